@@ -0,0 +1,97 @@
+import asyncio
+
+from discounts_domestic_air_accesorials import analyze_discounts_domestic_air_accesorials
+from discounts_domestic_ground import analyze_discounts_domestic_ground
+from discounts_international import analyze_discounts_international
+from table_events import table_sink
+
+# The extraction modules of one analysis, in the order /api/analyze returns
+# their tables, with the response key of each table they produce.
+MODULES = {
+    "domestic_air_accesorials": (
+        analyze_discounts_domestic_air_accesorials,
+        ["domesticAir", "accesorials"]),
+    "domestic_ground": (
+        analyze_discounts_domestic_ground,
+        ["domesticGround1", "domesticGround2", "domesticGround3"]),
+    "international": (
+        analyze_discounts_international,
+        ["international1", "international2", "response5"]),
+}
+
+
+async def run_module(module, file, weeklyChargesBand):
+    """Runs one extraction module and returns its tables keyed for the response."""
+    analyze, keys = MODULES[module]
+    tables = await analyze(file, weeklyChargesBand)
+    return dict(zip(keys, tables))
+
+
+async def run_modules(file, weeklyChargesBand):
+    """Yields (module, tables or exception) as each module finishes."""
+    async def named(module):
+        try:
+            return module, await run_module(module, file, weeklyChargesBand)
+        except Exception as e:
+            return module, e
+
+    tasks = [asyncio.ensure_future(named(module)) for module in MODULES]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_tables(file, weeklyChargesBand):
+    """Yields (module, table, value) for each table as soon as it is parsed.
+
+    A module that fails yields (module, None, exception) once. Tables of a
+    module served from the result cache are yielded when the module returns.
+    """
+    events = asyncio.Queue()
+
+    async def run(module):
+        # Set inside the task so the sink reaches the module's own tasks
+        # without leaking into the caller's context.
+        table_sink.set(lambda table, value: events.put_nowait((module, table, value)))
+        try:
+            result = await run_module(module, file, weeklyChargesBand)
+        except Exception as e:
+            result = e
+        events.put_nowait((module, None, result))
+
+    tasks = [asyncio.ensure_future(run(module)) for module in MODULES]
+    try:
+        emitted = set()
+        pending = len(tasks)
+        while pending:
+            module, table, value = await events.get()
+            if table is not None:
+                emitted.add(table)
+                yield module, table, value
+                continue
+
+            pending -= 1
+            if isinstance(value, Exception):
+                yield module, None, value
+                continue
+            for table, tableValue in value.items():
+                if table not in emitted:
+                    emitted.add(table)
+                    yield module, table, tableValue
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def discounts_list(results):
+    """Orders per-module tables into the `discounts` list of /api/analyze."""
+    return [results[module] for module in MODULES if module in results]
+
+
+async def analyze_contract(file, weeklyChargesBand):
+    results = await asyncio.gather(
+        *(run_module(module, file, weeklyChargesBand) for module in MODULES))
+    return list(results)
@@ -0,0 +1,84 @@
+import os
+import asyncio
+import time
+
+from analysis import analyze_contract
+from file_upload import upload_contract, index_sections, wait_for_files_active, resolve_band
+from resilience import start_deadline
+
+BATCH_MAX_CONTRACTS = int(os.getenv("BATCH_MAX_CONTRACTS", "50"))
+# Contracts of one batch analysed at the same time. Their model calls all
+# share the batch's request id, so the model_scheduler still lets other
+# requests through between them.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+async def analyze_batch(uploads, fileNames, weeklyChargesBands, concurrency=BATCH_CONCURRENCY):
+    """Analyses a portfolio of contracts and returns one result per contract.
+
+    `uploads` are new PDFs and `fileNames` contracts already in the File
+    API; `weeklyChargesBands` has one band per contract, uploads first. New
+    PDFs are uploaded in parallel together with their section subsets (see
+    section_index), readiness of all files is polled together, and at most
+    `concurrency` contracts are extracted at a time. A failing
+    contract is reported in its own result and does not stop the others.
+    """
+    start = time.perf_counter()
+    results = [
+        {"source": upload.filename, "status": "failed", "file_name": None,
+         "exactWeeklyBandRange": None, "discounts": None, "error": None}
+        for upload in uploads
+    ] + [
+        {"source": fileName, "status": "failed", "file_name": fileName,
+         "exactWeeklyBandRange": None, "discounts": None, "error": None}
+        for fileName in fileNames
+    ]
+
+    async def upload(file):
+        uploadedFile = await upload_contract(file)
+        await index_sections(file, uploadedFile)
+        return uploadedFile
+
+    uploaded = await asyncio.gather(
+        *(upload(file) for file in uploads), return_exceptions=True)
+    for result, uploadedFile in zip(results, uploaded):
+        if isinstance(uploadedFile, Exception):
+            result["error"] = str(uploadedFile)
+        else:
+            result["file_name"] = uploadedFile.name
+
+    files = await wait_for_files_active(
+        [result["file_name"] for result in results if result["file_name"]])
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze(result, weeklyChargesBand):
+        file = files.get(result["file_name"])
+        if isinstance(file, Exception):
+            result["error"] = str(file)
+        if result["error"] or file is None:
+            return
+        async with semaphore:
+            # Each contract gets its own budget once it is admitted.
+            start_deadline()
+            try:
+                result["exactWeeklyBandRange"] = await resolve_band(file, weeklyChargesBand)
+                result["discounts"] = await analyze_contract(
+                    file, result["exactWeeklyBandRange"])
+                result["status"] = "done"
+            except Exception as e:
+                result["error"] = str(e)
+
+    await asyncio.gather(
+        *(analyze(result, band) for result, band in zip(results, weeklyChargesBands)))
+
+    succeeded = sum(result["status"] == "done" for result in results)
+    return {
+        "results": results,
+        "summary": {
+            "contracts": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "seconds": round(time.perf_counter() - start, 3),
+        },
+    }
@@ -0,0 +1,214 @@
+import os
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+import requests
+from cachetools import TTLCache
+
+from analysis import MODULES, run_modules, discounts_list
+from file_upload import handle_file_upload, wait_for_file_active
+from model_scheduler import request_id
+from resilience import start_deadline
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "memory")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "analysis_jobs.sqlite3")
+JOB_STORE_SIZE = int(os.getenv("JOB_STORE_SIZE", "1024"))
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 60 * 60)))
+# Completion callbacks are only posted to these hosts.
+JOB_CALLBACK_HOSTS = os.getenv("JOB_CALLBACK_HOSTS", "localhost,127.0.0.1").split(",")
+JOB_CALLBACK_TIMEOUT = 10
+
+
+class MemoryJobStore:
+    """Job records in process memory, dropped after JOB_TTL."""
+
+    def __init__(self, maxsize=JOB_STORE_SIZE, ttl=JOB_TTL):
+        self.jobs = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, jobId):
+        return self.jobs.get(jobId)
+
+    def put(self, job):
+        self.jobs[job["job_id"]] = job
+
+    def __len__(self):
+        return len(self.jobs)
+
+
+class SQLiteJobStore:
+    """On-disk job records, readable by every worker process."""
+
+    def __init__(self, path=JOB_STORE_PATH, maxsize=JOB_STORE_SIZE, ttl=JOB_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, job TEXT NOT NULL, "
+                "created_at REAL NOT NULL)")
+
+    def get(self, jobId):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT job FROM jobs WHERE job_id = ? AND created_at > ?",
+                (jobId, time.time() - self.ttl)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, job):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)",
+                (job["job_id"], json.dumps(job), job["created_at"]))
+            self.conn.execute(
+                "DELETE FROM jobs WHERE created_at <= ?", (time.time() - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM jobs WHERE job_id NOT IN ("
+                "SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                (self.maxsize,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def create_store(backend=JOB_STORE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    if backend == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown job store backend: {backend}")
+
+
+def check_callback_url(callbackUrl):
+    url = urlparse(callbackUrl)
+    if url.scheme not in ("http", "https") or url.hostname not in JOB_CALLBACK_HOSTS:
+        raise ValueError(
+            f"callbackUrl must be an http(s) URL on one of: {', '.join(JOB_CALLBACK_HOSTS)}")
+
+
+class AnalysisJobs:
+    """Runs /api/analyze as background jobs on a fixed pool of workers.
+
+    Each module's tables are written to the job as soon as that module
+    finishes, so pollers see partial results. When the job ends its record
+    is POSTed to the optional callback URL.
+    """
+
+    def __init__(self, store, workers=ANALYSIS_WORKERS):
+        self.store = store
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        # Started on first submit, so the queue belongs to the running loop.
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.tasks = [asyncio.ensure_future(self.work()) for _ in range(self.workers)]
+
+    async def submit(self, upload, weeklyChargesBand, callbackUrl=None):
+        if callbackUrl:
+            check_callback_url(callbackUrl)
+        self.start()
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "file_name": None,
+            "exactWeeklyBandRange": None,
+            "modules": {},
+            "errors": {},
+            "discounts": None,
+            "error": None,
+        }
+        self.store.put(job)
+        self.submitted += 1
+        await self.queue.put((job, upload, weeklyChargesBand, callbackUrl))
+        return job
+
+    def get(self, jobId):
+        return self.store.get(jobId)
+
+    def update(self, job, **fields):
+        job.update(fields, updated_at=time.time())
+        self.store.put(job)
+
+    async def work(self):
+        while True:
+            job, upload, weeklyChargesBand, callbackUrl = await self.queue.get()
+            request_id.set(job["job_id"])
+            try:
+                await self.run(job, upload, weeklyChargesBand)
+            except Exception as e:
+                self.update(job, status="failed", error=str(e))
+            finally:
+                upload.file.close()
+                self.queue.task_done()
+
+            if job["status"] == "done":
+                self.completed += 1
+            else:
+                self.failed += 1
+            if callbackUrl:
+                await self.notify(job, callbackUrl)
+
+    async def run(self, job, upload, weeklyChargesBand):
+        # The job outlives the request that created it, so it gets its own budget.
+        start_deadline()
+        self.update(job, status="running")
+
+        uploadedFile, exactWeeklyBandRange = await handle_file_upload(upload, weeklyChargesBand)
+        self.update(job, file_name=uploadedFile.name,
+                    exactWeeklyBandRange=exactWeeklyBandRange)
+
+        file = await wait_for_file_active(uploadedFile.name)
+
+        async for module, result in run_modules(file, exactWeeklyBandRange):
+            if isinstance(result, Exception):
+                job["errors"][module] = str(result)
+            else:
+                job["modules"][module] = result
+            self.update(job)
+
+        if job["errors"]:
+            self.update(job, status="failed",
+                        error=f"{len(job['errors'])} of {len(MODULES)} modules failed")
+        else:
+            self.update(job, status="done", discounts=discounts_list(job["modules"]))
+
+    async def notify(self, job, callbackUrl):
+        try:
+            await asyncio.to_thread(
+                requests.post, callbackUrl, json=job, timeout=JOB_CALLBACK_TIMEOUT)
+        except Exception:
+            # The job record stays available for polling.
+            pass
+
+    def stats(self):
+        return {
+            "backend": type(self.store).__name__,
+            "entries": len(self.store),
+            "workers": self.workers,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+analysis_jobs = AnalysisJobs(create_store())
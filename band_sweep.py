@@ -0,0 +1,176 @@
+"""Extracts every weekly charges band of a contract in one pass.
+
+Band-dependent tables are requested once with a list of values per cell, one
+entry per band, and stored column-wise: `cells` holds the path of every leaf
+and `values` the matching row, either a list across the bands or a single
+value for cells that do not vary (such as "Weight Range"). Any band's tables
+are then sliced out locally.
+"""
+import asyncio
+import hashlib
+import json
+
+from gemini_client import generation_config, FLASH_MODEL, PRO_MODEL
+from result_cache import result_cache, contract_key, prompt_version
+from response_parser import request_table
+from table_schemas import (DOMESTIC_AIR, ACCESORIALS, DOMESTIC_GROUND_3, INTERNATIONAL_1,
+                           INTERNATIONAL_2, with_schema)
+from discounts_domestic_air_accesorials import (
+    analyze_discounts_domestic_air_accesorials, accesorials_config)
+from discounts_domestic_ground import analyze_discounts_domestic_ground, PORTFOLIO_TIER
+from discounts_international import (
+    analyze_discounts_international, merge_international, international2_config)
+from band_table import band_tables
+from prompts import prompts
+from file_upload import section_file
+
+
+def sweep_template(template):
+    """Turns every empty leaf of a table template into a per-band list."""
+    if isinstance(template, dict):
+        return {key: sweep_template(value) for key, value in template.items()}
+    if isinstance(template, list):
+        return [sweep_template(template[0])]
+    return [""] if template == "" else template
+
+
+def to_columns(value, template, bandCount, path=()):
+    """Flattens a swept table into (cells, values)."""
+    cells, values = [], []
+    if isinstance(template, dict):
+        for key, child in template.items():
+            childCells, childValues = to_columns(
+                (value or {}).get(key), child, bandCount, path + (key,))
+            cells += childCells
+            values += childValues
+    elif isinstance(template, list) and isinstance(template[0], (dict, list)):
+        for i, item in enumerate(value or []):
+            childCells, childValues = to_columns(item, template[0], bandCount, path + (i,))
+            cells += childCells
+            values += childValues
+    elif isinstance(template, list):
+        # One value per band; pad or cut what the model returned to fit.
+        row = list(value) if isinstance(value, list) else [value] * bandCount
+        cells.append(list(path))
+        values.append((row + [None] * bandCount)[:bandCount])
+    else:
+        cells.append(list(path))
+        values.append(value)
+    return cells, values
+
+
+def band_view(columns, band):
+    """Slices the table of one band out of its columns."""
+    table = {}
+    for path, row in zip(columns["cells"], columns["values"]):
+        node = table
+        for key, nextKey in zip(path, path[1:]):
+            if isinstance(node, list):
+                node.extend({} for _ in range(key + 1 - len(node)))
+            elif key not in node:
+                node[key] = [] if isinstance(nextKey, int) else {}
+            node = node[key]
+        node[path[-1]] = row[band] if isinstance(row, list) else row
+    return table
+
+
+# Band-dependent requests: (module whose pages they read, tables in the reply,
+# model, template, what to fill).
+SWEEP_REQUESTS = {
+    "domesticAir": ("domestic_air_accesorials", ["domesticAir"], FLASH_MODEL, DOMESTIC_AIR,
+                    "the domestic air table"),
+    "portfolioTier": ("domestic_ground", list(PORTFOLIO_TIER), PRO_MODEL, PORTFOLIO_TIER,
+                      "both tables from the portfolio tier incentive table. domesticGround1 is the incentive for each ground service. domesticGround2 is the incentives off effective rates for each weight range"),
+    "domesticGround3": ("domestic_ground", ["domesticGround3"], FLASH_MODEL, DOMESTIC_GROUND_3,
+                        "the table. there should be 2 rows. commodity tier is in addendum 1"),
+    "international1": ("international", ["international1"], PRO_MODEL, INTERNATIONAL_1,
+                       "the international service level table"),
+}
+
+SWEEP_VERSION = hashlib.sha256("".join([
+    prompt_version(band_view, prompts["sweep"], prompts["accesorials"], prompts["international_2"]),
+    *(func.prompt_version for func in (
+        analyze_discounts_domestic_air_accesorials, analyze_discounts_domestic_ground,
+        analyze_discounts_international)),
+]).encode()).hexdigest()[:12]
+
+
+async def request_sweep(files, name, bands):
+    module, tables, modelName, template, what = SWEEP_REQUESTS[name]
+    file = files[module]
+    swept = sweep_template(template)
+    response = await request_table(
+        modelName, file,
+        prompts.render("sweep", what=what, bands=json.dumps(bands)),
+        swept, with_schema(generation_config, swept), table=f"sweep_{name}")
+
+    if len(tables) == 1:
+        response, swept = {tables[0]: response}, {tables[0]: swept}
+
+    columns = {}
+    for table in tables:
+        cells, values = to_columns(response[table], swept[table], len(bands))
+        columns[table] = {"cells": cells, "values": values}
+    return columns
+
+
+async def sweep_contract(file):
+    """Returns every band's tables of a contract in columnar form.
+
+    Six model calls whatever the number of bands: one per band-dependent
+    request plus the accesorials and international2, which are the same for
+    every band. The result is cached per contract.
+    """
+    key = "|".join([contract_key(file), "sweep", SWEEP_VERSION])
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    bands = (await band_tables.get(file)).to_list()
+
+    modules = dict.fromkeys(module for module, *_ in SWEEP_REQUESTS.values())
+    files = dict(zip(modules, await asyncio.gather(
+        *(section_file(file, module) for module in modules))))
+
+    swept, accesorials, international2 = await asyncio.gather(
+        asyncio.gather(*(request_sweep(files, name, bands) for name in SWEEP_REQUESTS)),
+        request_table(FLASH_MODEL, files["domestic_air_accesorials"], prompts.render("accesorials"),
+                      ACCESORIALS, accesorials_config, table="accesorials"),
+        request_table(PRO_MODEL, files["international"], prompts.render("international_2"),
+                      INTERNATIONAL_2, international2_config, table="international_2"))
+
+    tables = {}
+    for columns in swept:
+        tables.update(columns)
+
+    sweep = {
+        "bands": bands,
+        "tables": tables,
+        "constant": {"accesorials": accesorials, "international2": international2},
+    }
+    result_cache.set(key, "sweep", sweep)
+    return sweep
+
+
+def sweep_discounts(sweep, exactWeeklyBandRange):
+    """Builds the `discounts` list of /api/analyze for one band of a sweep."""
+    band = sweep["bands"].index(exactWeeklyBandRange)
+    view = {table: band_view(columns, band) for table, columns in sweep["tables"].items()}
+    constant = sweep["constant"]
+
+    return [
+        {
+            "domesticAir": view["domesticAir"],
+            "accesorials": constant["accesorials"]
+        },
+        {
+            "domesticGround1": view["domesticGround1"],
+            "domesticGround2": view["domesticGround2"],
+            "domesticGround3": view["domesticGround3"],
+        },
+        {
+            "international1": view["international1"],
+            "international2": constant["international2"],
+            "response5": merge_international(view["international1"], constant["international2"]),
+        }
+    ]
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import bisect
+import math
+import re
+from cachetools import LRUCache, TTLCache
+
+from gemini_client import generation_config, FLASH_MODEL
+from result_cache import result_cache, contract_key, prompt_version
+from response_parser import request_table, TableParseError
+from table_schemas import with_schema
+from prompts import prompts
+
+BAND_TABLE_CACHE_SIZE = int(os.getenv("BAND_TABLE_CACHE_SIZE", "1024"))
+# How long a contract whose band table could not be read goes straight to
+# the per-amount model lookup.
+BAND_TABLE_FAILURE_TTL = float(os.getenv("BAND_TABLE_FAILURE_TTL", "3600"))
+
+BAND_TABLE = {"weeklyChargesBands": [""]}
+band_table_config = with_schema(generation_config, BAND_TABLE)
+
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def parse_amount(text):
+    """Reads a weekly charge such as "16,856" or "$16,856.00"."""
+    match = NUMBER.search(str(text))
+    if not match:
+        raise ValueError(f"No amount in {text!r}")
+    return float(match.group().replace(",", ""))
+
+
+def parse_range(label):
+    """Reads a band label such as "0.01 - 19,429.99" or "$142,000.00+".
+
+    A label with a single amount is open-ended upwards.
+    """
+    amounts = [float(number.replace(",", "")) for number in NUMBER.findall(label)]
+    if not amounts:
+        raise ValueError(f"No range in {label!r}")
+    return amounts[0], amounts[1] if len(amounts) > 1 else math.inf
+
+
+class BandTable:
+    """A contract's weekly charges bands as sorted numeric ranges."""
+
+    def __init__(self, labels):
+        bands = sorted((*parse_range(label), label) for label in labels)
+        if not bands:
+            raise ValueError("The contract has no weekly charges bands")
+        self.lows = [low for low, _, _ in bands]
+        self.highs = [high for _, high, _ in bands]
+        self.labels = [label for _, _, label in bands]
+
+    def resolve(self, weeklyCharges):
+        """Returns the label of the band that contains the weekly charges.
+
+        Amounts below the first band fall in the first band, and amounts
+        past every band (or in a gap between two) in the highest band that
+        starts at or below them. A band label is returned unchanged.
+        """
+        if weeklyCharges in self.labels:
+            return weeklyCharges
+        amount = parse_amount(weeklyCharges)
+        return self.labels[max(bisect.bisect_right(self.lows, amount) - 1, 0)]
+
+    def to_list(self):
+        return list(self.labels)
+
+
+async def extract_band_labels(file):
+    response = await request_table(
+        FLASH_MODEL, file, prompts.render("band_table"),
+        BAND_TABLE, band_table_config, table="band_table")
+    return [label for label in response["weeklyChargesBands"] if label]
+
+
+BAND_TABLE_VERSION = prompt_version(extract_band_labels, prompts["band_table"])
+
+
+class BandTables:
+    """Extracts each contract's band table once and resolves bands locally.
+
+    Parsed tables are kept in memory; the extracted labels are also stored
+    in the result cache so they survive restarts. A table that cannot be
+    read is remembered for BAND_TABLE_FAILURE_TTL, so callers fall back to
+    the model lookup without extracting it again on every request.
+    """
+
+    def __init__(self, maxsize=BAND_TABLE_CACHE_SIZE, failureTtl=BAND_TABLE_FAILURE_TTL):
+        self.tables = LRUCache(maxsize=maxsize)
+        self.failures = TTLCache(maxsize=maxsize, ttl=failureTtl)
+        self.pending = {}
+        self.hits = 0
+        self.failureHits = 0
+        self.extractions = 0
+
+    async def get(self, file):
+        key = "|".join([contract_key(file), "band_table", BAND_TABLE_VERSION])
+        table = self.tables.get(key)
+        if table is not None:
+            self.hits += 1
+            return table
+        failure = self.failures.get(key)
+        if failure is not None:
+            self.failureHits += 1
+            raise ValueError(failure)
+
+        if key not in self.pending:
+            self.pending[key] = asyncio.ensure_future(self.load(key, file))
+        try:
+            return await asyncio.shield(self.pending[key])
+        finally:
+            self.pending.pop(key, None)
+
+    async def load(self, key, file):
+        try:
+            labels = result_cache.get(key)
+            if labels is None:
+                self.extractions += 1
+                labels = await extract_band_labels(file)
+                table = BandTable(labels)
+                result_cache.set(key, "band_table", labels)
+            else:
+                table = BandTable(labels)
+        except (ValueError, TableParseError) as e:
+            self.failures[key] = str(e)
+            raise
+        self.tables[key] = table
+        return table
+
+    async def resolve(self, file, weeklyCharges):
+        return (await self.get(file)).resolve(weeklyCharges)
+
+    def stats(self):
+        return {
+            "tables": len(self.tables),
+            "hits": self.hits,
+            "extractions": self.extractions,
+            "failures": len(self.failures),
+            "failure_hits": self.failureHits,
+        }
+
+
+band_tables = BandTables()
@@ -0,0 +1,401 @@
+"""Offline benchmark for the extraction pipeline.
+
+Runs the three discount modules against a local fake client that answers every
+message after a fixed delay, so the effect of overlapping the model calls can
+be measured without touching the Gemini API. The fake reuses the real
+GeminiClient call path, including the model_scheduler.
+
+    python benchmark.py --latency 0.5
+    python benchmark.py --latency 0.5 --load 20 --max-in-flight 8 --rpm 600
+    python benchmark.py --latency 0.5 --context-cache --contract-tokens 60000
+    python benchmark.py --latency 0.5 --stream
+    python benchmark.py --latency 0.5 --batch 24 --max-in-flight 32
+    python benchmark.py --latency 0.5 --bands 20
+    python benchmark.py --latency 0.5 --sweep
+    python benchmark.py --latency 0.05 --hedge 200 --tail-probability 0.02 --tail-latency 2
+    python benchmark.py --latency 0.05 --faults 100 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import io
+import os
+import json
+import random
+import time
+import uuid
+
+os.environ.setdefault("API_KEY", "offline-benchmark")
+os.environ.setdefault("RESULT_CACHE_PATH", ":memory:")
+
+from starlette.datastructures import Headers, UploadFile
+
+import discounts_domestic_air_accesorials
+import discounts_domestic_ground
+import discounts_international
+import chat
+from analysis import analyze_contract
+from analysis_batch import analyze_batch
+from band_sweep import sweep_contract
+from file_upload import handle_file_upload, wait_for_file_active, resolve_band, lookup_band_with_model
+import gemini_client
+import model_scheduler
+import response_parser
+import resilience
+from hedging import Hedger, percentile, HEDGE_MIN_SAMPLES
+from result_cache import result_cache
+from gemini_client import set_client
+from model_scheduler import ModelCallScheduler, request_id
+from model_router import ModelRouter, FLASH_MODEL
+from resilience import CircuitBreakers
+from fake_gemini import FakeClient, FaultyClient, FakeFile, FAKE_VALUES, sample_contract
+
+
+async def run_analysis():
+    request_id.set(uuid.uuid4().hex)
+    file = FakeFile()
+    await asyncio.gather(
+        discounts_domestic_air_accesorials.analyze_discounts_domestic_air_accesorials(
+            file, "0.01 - 19,429.99"),
+        discounts_domestic_ground.analyze_discounts_domestic_ground(
+            file, "0.01 - 19,429.99"),
+        discounts_international.analyze_discounts_international(
+            file, "0.01 - 19,429.99"),
+    )
+
+
+def bench(latency, blocking):
+    fake = FakeClient(latency, blocking=blocking)
+    set_client(fake)
+
+    start = time.perf_counter()
+    asyncio.run(run_analysis())
+    return time.perf_counter() - start, fake
+
+
+def context_cache_test(args):
+    """Analyses one contract and chats about it, with and without caching."""
+    async def run(fake):
+        set_client(fake)
+        file = FakeFile()
+        start = time.perf_counter()
+        for band in ("0.01 - 19,429.99", "19,430.00 - 37,779.99"):
+            await asyncio.gather(
+                discounts_domestic_air_accesorials.analyze_discounts_domestic_air_accesorials(file, band),
+                discounts_domestic_ground.analyze_discounts_domestic_ground(file, band),
+                discounts_international.analyze_discounts_international(file, band),
+            )
+        sessionId = None
+        for turn in range(args.chat_turns):
+            _, sessionId = await chat.handle_chat(file, f"question {turn}", [], sessionId)
+        return time.perf_counter() - start
+
+    for contextCaching in (False, True):
+        fake = FakeClient(args.latency, contextCaching=contextCaching,
+                          contractTokens=args.contract_tokens,
+                          prefillPer1k=args.prefill_ms_per_1k / 1000)
+        elapsed = asyncio.run(run(fake))
+        ttft = sum(fake.first_token_times) / len(fake.first_token_times)
+        print(f"context caching {'on ' if contextCaching else 'off'}: "
+              f"{fake.calls} calls, {fake.input_tokens} uncached input tokens, "
+              f"{fake.cached_tokens} cached input tokens, "
+              f"mean time to first token {ttft:.3f}s, wall clock {elapsed:.2f}s")
+
+
+def stream_test(args):
+    """Time to the first chunk of a streamed chat reply vs. the whole reply."""
+    async def run():
+        file = FakeFile()
+        start = time.perf_counter()
+        _, sessionId = await chat.handle_chat(file, "question", [])
+        buffered = time.perf_counter() - start
+
+        _, entry = await chat.open_session(file, [], sessionId)
+        start = time.perf_counter()
+        firstChunk = None
+        async for _ in chat.stream_chat(entry, "question"):
+            firstChunk = firstChunk or time.perf_counter() - start
+        return buffered, firstChunk, time.perf_counter() - start
+
+    set_client(FakeClient(args.latency))
+    buffered, firstChunk, streamed = asyncio.run(run())
+    print(f"buffered reply:   {buffered:.2f}s until anything is shown")
+    print(f"streamed reply:   first chunk after {firstChunk:.2f}s, complete after {streamed:.2f}s")
+
+
+def fake_upload(i):
+    return UploadFile(io.BytesIO(sample_contract(f"{i} {uuid.uuid4().hex}")),
+                      filename=f"contract-{i}.pdf",
+                      headers=Headers({"content-type": "application/pdf"}))
+
+
+def band_test(args):
+    """Model calls and time for --bands band lookups on one contract."""
+    amounts = [str(1000 * (i + 1)) for i in range(args.bands)]
+
+    for name, lookup in (("model per amount", lookup_band_with_model),
+                         ("local band table", resolve_band)):
+        fake = FakeClient(args.latency)
+        set_client(fake)
+        file = FakeFile()
+
+        async def run():
+            return [await lookup(file, amount) for amount in amounts]
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        print(f"{name:>16}: {args.bands} lookups, {fake.calls} model calls, {elapsed:.3f}s")
+
+
+def sweep_test(args):
+    """Model calls to get every band of one contract: per band vs. one sweep."""
+    bands = FAKE_VALUES["weeklyChargesBands"]
+
+    async def per_band(file):
+        for band in bands:
+            await analyze_contract(file, band)
+
+    for name, run in (("per band", per_band), ("sweep", sweep_contract)):
+        fake = FakeClient(args.latency)
+        set_client(fake)
+        start = time.perf_counter()
+        asyncio.run(run(FakeFile()))
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8}: {len(bands)} bands, {fake.calls} model calls, "
+              f"{fake.output_tokens} est. output tokens, {elapsed:.2f}s")
+
+
+def batch_test(args):
+    """Contracts per minute: --batch contracts one by one vs. /api/analyze/batch."""
+    scheduler = ModelCallScheduler(
+        maxInFlight=args.max_in_flight, requestsPerMinute=args.rpm,
+        tokensPerMinute=args.tpm)
+    model_scheduler.scheduler = gemini_client.scheduler = scheduler
+
+    async def sequential():
+        for i in range(args.batch):
+            uploadedFile, band = await handle_file_upload(fake_upload(i), "16856")
+            file = await wait_for_file_active(uploadedFile.name)
+            await analyze_contract(file, band)
+
+    async def batch():
+        uploads = [fake_upload(i) for i in range(args.batch)]
+        result = await analyze_batch(uploads, [], ["16856"] * args.batch)
+        assert result["summary"]["failed"] == 0, result["summary"]
+
+    for name, run in (("one by one", sequential), ("batch", batch)):
+        fake = FakeClient(args.latency)
+        set_client(fake)
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10}: {args.batch} contracts, {fake.calls} model calls, "
+              f"{elapsed:.2f}s, {args.batch / elapsed * 60:.0f} contracts/minute")
+
+
+def load_test(args):
+    """Runs --load analyses at once through a scheduler built from the flags."""
+    scheduler = ModelCallScheduler(
+        maxInFlight=args.max_in_flight, requestsPerMinute=args.rpm,
+        tokensPerMinute=args.tpm)
+    # gemini_client imported the scheduler by name, so rebind it there too.
+    model_scheduler.scheduler = gemini_client.scheduler = scheduler
+
+    fake = FakeClient(args.latency)
+    set_client(fake)
+
+    async def timed():
+        start = time.perf_counter()
+        await run_analysis()
+        return time.perf_counter() - start
+
+    async def run():
+        return await asyncio.gather(*(timed() for _ in range(args.load)))
+
+    start = time.perf_counter()
+    durations = sorted(asyncio.run(run()))
+    elapsed = time.perf_counter() - start
+
+    print(f"analyses: {args.load}, model calls: {fake.calls}, wall clock: {elapsed:.2f}s")
+    print(f"per analysis: min {durations[0]:.2f}s, max {durations[-1]:.2f}s")
+    print(f"scheduler: {json.dumps(scheduler.stats())}")
+
+
+class TailClient(FakeClient):
+    """A fake whose replies now and then take much longer than usual."""
+
+    def __init__(self, latency, tailProbability, tailLatency, seed=0):
+        super().__init__(latency)
+        self.tailProbability = tailProbability
+        self.tailLatency = tailLatency
+        self.rng = random.Random(seed)
+
+    def reply(self, chat_session, content, generation_config):
+        text, latency, usage = super().reply(chat_session, content, generation_config)
+        if self.rng.random() < self.tailProbability:
+            latency = self.tailLatency
+        return text, latency, usage
+
+
+def hedge_test(args):
+    """Runs --hedge analyses with a slow tail, without and with hedging.
+
+    Each run starts with untimed analyses until every table has the
+    latency samples hedging needs.
+    """
+
+    async def run(count):
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def timed():
+            async with semaphore:
+                start = time.perf_counter()
+                await run_analysis()
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*(timed() for _ in range(count)))
+
+    async def warm_then_run():
+        await run(HEDGE_MIN_SAMPLES)
+        return await run(args.hedge)
+
+    for enabled in (False, True):
+        # A fresh scheduler per run, so the first run's RPM use does not
+        # throttle the second.
+        model_scheduler.scheduler = gemini_client.scheduler = ModelCallScheduler(
+            maxInFlight=args.max_in_flight, requestsPerMinute=args.rpm,
+            tokensPerMinute=args.tpm)
+        fake = TailClient(args.latency, args.tail_probability, args.tail_latency)
+        set_client(fake)
+        hedger = response_parser.hedger = Hedger(enabled=enabled)
+        # Both runs start from an empty result cache, which slows as it fills.
+        result_cache.purge()
+        durations = asyncio.run(warm_then_run())
+        stats = hedger.stats()
+        print(f"hedging {'on ' if enabled else 'off'}: p50 {percentile(durations, 50):.3f}s, "
+              f"p99 {percentile(durations, 99):.3f}s, model calls {fake.calls}, "
+              f"hedges {stats['hedges']} ({stats['hedge_rate']:.1%}), hedge wins {stats['hedge_wins']}")
+
+
+def fault_test(args):
+    """Runs --faults analyses against a fake that fails --error-rate of calls.
+
+    Compares no retries with the default retries, then takes the flash model
+    down completely so its breaker opens and tables move to the other model.
+    """
+
+    async def run(count):
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def attempt():
+            async with semaphore:
+                try:
+                    await run_analysis()
+                    return True
+                except Exception:
+                    return False
+
+        return await asyncio.gather(*(attempt() for _ in range(count)))
+
+    attempts = resilience.RETRY_MAX_ATTEMPTS
+    # Keeps the backoff in proportion to the fake's latency.
+    resilience.RETRY_BASE_DELAY = args.latency
+    runs = [("no retries", 1, ()), ("retries", attempts, ()),
+            (f"{FLASH_MODEL} down", attempts, (FLASH_MODEL,))]
+    for label, maxAttempts, down in runs:
+        resilience.RETRY_MAX_ATTEMPTS = maxAttempts
+        model_scheduler.scheduler = gemini_client.scheduler = ModelCallScheduler(
+            maxInFlight=args.max_in_flight, requestsPerMinute=args.rpm,
+            tokensPerMinute=args.tpm)
+        breakers = resilience.breakers = gemini_client.breakers = \
+            response_parser.breakers = CircuitBreakers()
+        response_parser.router = ModelRouter()
+        fake = FaultyClient(args.latency, errorRate=args.error_rate, down=down)
+        set_client(fake)
+        result_cache.purge()
+
+        start = time.perf_counter()
+        outcomes = asyncio.run(run(args.faults))
+        elapsed = time.perf_counter() - start
+        states = {name: stats["state"] for name, stats in breakers.stats().items()}
+        print(f"{label}: {sum(outcomes)}/{len(outcomes)} analyses succeeded in {elapsed:.2f}s, "
+              f"model calls {fake.calls}, injected faults {fake.faults}, breakers {states}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="seconds the fake model takes per message")
+    parser.add_argument("--load", type=int, default=0,
+                        help="run this many concurrent analyses through the scheduler")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=0,
+                        help="requests per minute budget, 0 to disable")
+    parser.add_argument("--tpm", type=float, default=0,
+                        help="tokens per minute budget, 0 to disable")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="compare runs with and without context caching")
+    parser.add_argument("--contract-tokens", type=int, default=60000,
+                        help="tokens the fake counts for each attached contract")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=5.0,
+                        help="fake time to first token per 1k uncached input tokens")
+    parser.add_argument("--chat-turns", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=0,
+                        help="compare this many contracts one by one and as a batch")
+    parser.add_argument("--bands", type=int, default=0,
+                        help="resolve this many weekly charges on one contract")
+    parser.add_argument("--sweep", action="store_true",
+                        help="compare analysing every band one by one with a sweep")
+    parser.add_argument("--stream", action="store_true",
+                        help="compare buffered and streamed chat replies")
+    parser.add_argument("--hedge", type=int, default=0,
+                        help="compare this many analyses without and with hedging")
+    parser.add_argument("--tail-probability", type=float, default=0.02,
+                        help="share of fake replies that take --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="analyses run at once with --hedge or --faults")
+    parser.add_argument("--faults", type=int, default=0,
+                        help="run this many analyses against a fake that injects errors")
+    parser.add_argument("--error-rate", type=float, default=0.05,
+                        help="share of fake calls that fail with a 429 or 503")
+    args = parser.parse_args()
+
+    if args.load:
+        load_test(args)
+        return
+    if args.context_cache:
+        context_cache_test(args)
+        return
+    if args.stream:
+        stream_test(args)
+        return
+    if args.batch:
+        batch_test(args)
+        return
+    if args.bands:
+        band_test(args)
+        return
+    if args.sweep:
+        sweep_test(args)
+        return
+    if args.hedge:
+        hedge_test(args)
+        return
+    if args.faults:
+        fault_test(args)
+        return
+
+    blocking_time, _ = bench(args.latency, blocking=True)
+    async_time, fake = bench(args.latency, blocking=False)
+
+    print(f"model calls per analysis: {fake.calls}")
+    print(f"est. prompt tokens (excluding the contract): {fake.input_tokens}")
+    print(f"est. output tokens (empty tables): {fake.output_tokens}")
+    print(f"blocking calls:     {blocking_time:.2f}s")
+    print(f"non-blocking calls: {async_time:.2f}s")
+    print(f"speedup:            {blocking_time / async_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Load benchmark for the HTTP API against a replayed Gemini backend.
+
+Drives /api/analyze, /api/chat and the per-module endpoints in-process at each
+concurrency level and reports p50/p95/p99 latency and throughput. Replies come
+from a cassette recorded with gemini_replay.py (or schema samples without
+one), so the suite needs no network or API key. Uploads are a small valid
+multi-page contract, so /api/analyze includes the page-subset upload path.
+It needs the dev requirements (pip install -r requirements-dev.txt).
+
+    python benchmark_suite.py --cassette cassettes/contract.jsonl
+    python benchmark_suite.py --latency lognormal:0.8,0.5 --concurrency 1,8,32 --requests 64
+    python benchmark_suite.py --scenarios analyze --warm --json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+import uuid
+
+os.environ.setdefault("API_KEY", "offline-benchmark")
+os.environ.setdefault("RESULT_CACHE_PATH", ":memory:")
+
+import httpx
+
+import main
+from gemini_client import set_client
+from gemini_replay import ReplayClient
+from fake_gemini import sample_contract
+from metrics import section_files
+
+MODULE_ENDPOINTS = [
+    "/api/discounts-domestic-air-accesorials",
+    "/api/discounts-domestic-ground",
+    "/api/discounts_international",
+]
+DEFAULT_CHAT_MESSAGE = "What is the Next Day Air discount?"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+WARM_CONTRACT = sample_contract()
+
+
+def pdf_bytes(warm):
+    # A valid multi-page contract, so uploads take the real page-subset path.
+    # Distinct bytes per request unless --warm, so the upload and result
+    # caches do not answer for the model.
+    return WARM_CONTRACT if warm else sample_contract(uuid.uuid4().hex)
+
+
+async def upload(http, warm):
+    response = await http.post(
+        "/api/upload-file", data={"weeklyChargesBand": "16856"},
+        files={"file": ("contract.pdf", pdf_bytes(warm), "application/pdf")})
+    response.raise_for_status()
+    return response.json()
+
+
+def scenarios(args, chatMessage):
+    async def analyze(http, i, setup):
+        return await http.post(
+            "/api/analyze", data={"weeklyChargesBand": "16856"},
+            files={"file": ("contract.pdf", pdf_bytes(args.warm), "application/pdf")})
+
+    async def chat(http, i, setup):
+        return await http.post("/api/chat", json={
+            "fileName": setup[i % len(setup)]["file_name"], "message": chatMessage})
+
+    async def modules(http, i, setup):
+        uploaded = setup[i % len(setup)]
+        body = {"fileName": uploaded["file_name"],
+                "weeklyChargesBand": uploaded["exactWeeklyBandRange"]}
+        responses = await asyncio.gather(
+            *(http.post(endpoint, json=body) for endpoint in MODULE_ENDPOINTS))
+        return next((r for r in responses if r.status_code != 200), responses[0])
+
+    return {"analyze": analyze, "chat": chat, "modules": modules}
+
+
+async def run_level(http, scenario, concurrency, requests, setup):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await scenario(http, i, setup)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "throughput": requests / elapsed,
+    }
+
+
+async def run_suite(args):
+    client = ReplayClient(args.cassette, latency=args.latency, seed=args.seed)
+    set_client(client)
+    chatMessage = (client.chat_prompts() or [DEFAULT_CHAT_MESSAGE])[0]
+
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark",
+                                 timeout=None) as http:
+        named = scenarios(args, chatMessage)
+        for name in args.scenarios.split(","):
+            for concurrency in (int(level) for level in args.concurrency.split(",")):
+                setup = []
+                if name != "analyze":
+                    # Uploads are setup, not part of the measured requests.
+                    count = 1 if args.warm else args.requests
+                    setup = await asyncio.gather(*(upload(http, args.warm) for _ in range(count)))
+                level = await run_level(http, named[name], concurrency, args.requests, setup)
+                results.append({"scenario": name, **level})
+    return results, client.stats()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassette", help="replies recorded with gemini_replay.py")
+    parser.add_argument("--latency", default="lognormal:0.5,0.4",
+                        help="fixed:S, uniform:MIN,MAX, lognormal:MEDIAN,SIGMA or recorded[:SCALE]")
+    parser.add_argument("--scenarios", default="analyze,chat,modules")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32,
+                        help="requests per scenario and concurrency level")
+    parser.add_argument("--warm", action="store_true",
+                        help="reuse one contract so the upload and result caches are hit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results, replay = asyncio.run(run_suite(args))
+    # Which file each module attached: its page subset or the whole contract.
+    sections = {f"{module}/{source}": count
+                for (module, source), count in sorted(section_files.values.items())}
+
+    if args.json:
+        print(json.dumps({"results": results, "replay": replay, "sections": sections}, indent=2))
+        return
+
+    print(f"{'scenario':<10}{'conc':>6}{'reqs':>6}{'errors':>8}"
+          f"{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'req/s':>9}")
+    for result in results:
+        print(f"{result['scenario']:<10}{result['concurrency']:>6}{result['requests']:>6}"
+              f"{result['errors']:>8}{result['p50']:>9.3f}{result['p95']:>9.3f}"
+              f"{result['p99']:>9.3f}{result['throughput']:>9.2f}")
+    print(f"replay: {json.dumps(replay)}")
+    print(f"sections: {json.dumps(sections)}")
+
+
+if __name__ == "__main__":
+    main_cli()
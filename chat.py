@@ -1,38 +1,89 @@
-import os
-import google.generativeai as genai
-import dotenv
+from contextlib import aclosing
 
-dotenv.load_dotenv()
+from gemini_client import get_client, FLASH_MODEL
+from chat_sessions import chat_sessions
+from upload_cache import active_files, FILE_GONE_ERRORS
 
-os.environ["GRPC_VERBOSITY"] = "ERROR"
-os.environ["GLOG_minloglevel"] = "2"
+CHAT_TURNS = [
+    {
+        "role": "user",
+        "parts": [
+            "Use the attached contract as a context to answer my queries"
+        ]
+    }
+]
 
 
-genai.configure(api_key=os.getenv("API_KEY"))
+async def open_session(file, chat_history, session_id=None):
+    """Returns (session_id, entry) for a chat about this contract.
 
-model = genai.GenerativeModel("gemini-1.5-flash")
+    A live session only needs the new message. When the session is unknown
+    (first turn, evicted, or the server restarted) or the cached context it
+    was started from is gone, a new one is rebuilt from the client-supplied
+    chat_history.
+    """
+    client = get_client()
 
-async def handle_chat(file, message, chat_history):
-    history = [
-        {
-            "role": "user",
-            "parts": [
-                    file,
-                    "Use the attached contract as a context to answer my queries"
-            ]
-        }
-    ]
+    entry = chat_sessions.get(session_id, file.name)
+    if entry is not None and not await client.context_alive(entry.chat_session):
+        chat_sessions.delete(entry.sessionId)
+        entry = None
+    if entry is None:
+        history = []
 
-    for chat in chat_history:
-        history.append({
-            "role": chat.role,
-            "parts": [
-                chat.content
-            ]
-        })
+        for chat in chat_history:
+            history.append({
+                "role": chat.role,
+                "parts": [
+                    chat.content
+                ]
+            })
 
-    chat_session = model.start_chat(history=history)
+        chat_session = await client.start_contract_chat(FLASH_MODEL, file, CHAT_TURNS, history)
+        pinned = len(chat_session.history) - len(history)
+        session_id, entry = chat_sessions.create(file.name, chat_session, pinned)
 
-    response = chat_session.send_message(message)
+    return session_id, entry
 
-    return response.text
+
+def forget_session(entry):
+    """Drops a session whose contract file or cached context the API lost.
+
+    The next turn rebuilds it from chat_history with a fresh upload.
+    """
+    active_files.forget(entry.fileName)
+    get_client().forget_context(entry.chat_session)
+    chat_sessions.delete(entry.sessionId)
+
+
+async def handle_chat(file, message, chat_history, session_id=None):
+    """Answers one chat turn and returns (reply, session_id)."""
+    client = get_client()
+    session_id, entry = await open_session(file, chat_history, session_id)
+
+    # Turns of one session must not interleave in its history.
+    async with entry.lock:
+        try:
+            response = await client.send_message(entry.chat_session, message)
+        except FILE_GONE_ERRORS:
+            forget_session(entry)
+            raise
+        chat_sessions.trim(entry)
+
+    return response.text, session_id
+
+
+async def stream_chat(entry, message):
+    """Yields the reply to one chat turn as it is generated."""
+    client = get_client()
+
+    # aclosing releases the model call as soon as the consumer stops reading.
+    async with entry.lock, aclosing(
+            client.stream_message(entry.chat_session, message)) as stream:
+        try:
+            async for text in stream:
+                yield text
+        except FILE_GONE_ERRORS:
+            forget_session(entry)
+            raise
+        chat_sessions.trim(entry)
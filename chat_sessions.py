@@ -0,0 +1,99 @@
+import os
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+
+from model_scheduler import estimate_tokens
+
+CHAT_SESSION_IDLE_TIMEOUT = int(os.getenv("CHAT_SESSION_IDLE_TIMEOUT", "1800"))
+CHAT_SESSION_MAX_SESSIONS = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "1000"))
+# Estimated tokens of conversation kept per session; older turns are dropped.
+CHAT_SESSION_MAX_TOKENS = int(os.getenv("CHAT_SESSION_MAX_TOKENS", "32000"))
+
+
+class ChatSessionEntry:
+    def __init__(self, sessionId, fileName, chat_session, pinned):
+        self.sessionId = sessionId
+        self.fileName = fileName
+        self.chat_session = chat_session
+        # Leading history entries (the inline contract preamble) never trimmed.
+        self.pinned = pinned
+        self.lock = asyncio.Lock()
+        self.lastUsed = time.monotonic()
+
+
+class ChatSessionStore:
+    """Holds chat sessions in memory between /api/chat turns.
+
+    Sessions idle for longer than the timeout are evicted, as are the least
+    recently used ones past the session limit. Each session keeps at most
+    maxTokens of conversation, dropping its oldest turns first.
+    """
+
+    def __init__(self, idleTimeout=CHAT_SESSION_IDLE_TIMEOUT,
+                 maxSessions=CHAT_SESSION_MAX_SESSIONS, maxTokens=CHAT_SESSION_MAX_TOKENS):
+        self.idleTimeout = idleTimeout
+        self.maxSessions = maxSessions
+        self.maxTokens = maxTokens
+        self.sessions = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.trimmed_turns = 0
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idleTimeout
+        while self.sessions:
+            sessionId, entry = next(iter(self.sessions.items()))
+            if entry.lastUsed > cutoff:
+                break
+            del self.sessions[sessionId]
+            self.evictions += 1
+
+    def get(self, sessionId, fileName):
+        """Returns the live session for this contract, or None."""
+        self.evict_idle()
+        entry = self.sessions.get(sessionId) if sessionId else None
+        if entry is None or entry.fileName != fileName:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.lastUsed = time.monotonic()
+        self.sessions.move_to_end(sessionId)
+        return entry
+
+    def create(self, fileName, chat_session, pinned=0):
+        self.evict_idle()
+        sessionId = uuid.uuid4().hex
+        self.sessions[sessionId] = ChatSessionEntry(sessionId, fileName, chat_session, pinned)
+        while len(self.sessions) > self.maxSessions:
+            self.sessions.popitem(last=False)
+            self.evictions += 1
+        return sessionId, self.sessions[sessionId]
+
+    def delete(self, sessionId):
+        return self.sessions.pop(sessionId, None) is not None
+
+    def trim(self, entry):
+        """Drops the oldest user/model turn pairs until under the token cap."""
+        history = list(entry.chat_session.history)
+        start = entry.pinned
+        while (len(history) - start > 2
+               and estimate_tokens(history[start:]) > self.maxTokens):
+            del history[start:start + 2]
+            self.trimmed_turns += 1
+        entry.chat_session.history = history
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "trimmed_turns": self.trimmed_turns,
+        }
+
+
+chat_sessions = ChatSessionStore()
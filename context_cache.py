@@ -0,0 +1,192 @@
+import os
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from cachetools import TTLCache
+
+from resilience import (
+    call_with_retries, CircuitOpenError, DeadlineExceededError, TRANSIENT_ERRORS)
+
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "64"))
+# Timeout of each create, update or delete of a cached context.
+CONTEXT_CACHE_TIMEOUT = float(os.getenv("CONTEXT_CACHE_TIMEOUT", "30"))
+# Extend a cache's lifetime once it has less than this left.
+CONTEXT_CACHE_REFRESH_WINDOW = 300
+# Circuit breaker shared by the cached-content calls (see resilience).
+CONTEXT_CACHE_BREAKER = "cached_contents"
+
+# The preamble every extraction call starts from. It does not depend on the
+# weekly band or the module, so one cached context per contract and model is
+# shared by all tables.
+EXTRACTION_TURNS = [
+    {
+        "role":
+        "user",
+        "parts": [
+            "Use the attached contract to fill the table. DOMESTIC AIR SERVICE LEVEL WEIGHT RANGE CURRENT UPS\nNext Day Air Letter All\nNext Day Air Package All\nNext Day Air Saver Letter All\nNext Day Air Saver Package All\n2nd Day AM Letter All\n2nd Day AM Package All\n2nd Day Air Letter All\n2nd Day Air Package All\n3 Day Select Package All\nNext Day Air CWT All\nNext Day Air Saver CWT All\n2nd Day Air AM CWT All\n2nd Day Air CWT All\n3 Day Select CWT All",
+        ],
+    },
+    {
+        "role":
+        "model",
+        "parts": [
+            "```json\n{\"Domestic Air Service Level\": {\"Next Day Air\": {\"Letter\": {\"Weight Range\": \"All\", \"Current UPS\": \"61.00%\"}, \"Package\": {\"Weight Range\": \"All\", \"Current UPS\": \"61.00%\"}}, \"Next Day Air Saver\": {\"Letter\": {\"Weight Range\": \"All\", \"Current UPS\": \"61.00%\"}, \"Package\": {\"Weight Range\": \"All\", \"Current UPS\": \"61.00%\"}}, \"2nd Day AM\": {\"Letter\": {\"Weight Range\": \"All\", \"Current UPS\": \"59.00%\"}, \"Package\": {\"Weight Range\": \"All\", \"Current UPS\": \"59.00%\"}}, \"2nd Day Air\": {\"Letter\": {\"Weight Range\": \"All\", \"Current UPS\": \"59.00%\"}, \"Package\": {\"Weight Range\": \"All\", \"Current UPS\": \"59.00%\"}}, \"3 Day Select\": {\"Package\": {\"Weight Range\": \"All\", \"Current UPS\": \"51.00%\"}}, \"Next Day Air CWT\": {\"Weight Range\": \"All\", \"Current UPS\": null}, \"Next Day Air Saver CWT\": {\"Weight Range\": \"All\", \"Current UPS\": null}, \"2nd Day AM CWT\": {\"Weight Range\": \"All\", \"Current UPS\": null}, \"2nd Day Air CWT\": {\"Weight Range\": \"All\", \"Current UPS\": null}, \"3 Day Select CWT\": {\"Weight Range\": \"All\", \"Current UPS\": null}}}\n```",
+        ],
+    },
+]
+
+
+def contract_turns(file, turns):
+    """Attaches the contract to the first turn of a static preamble."""
+    first, *rest = turns
+    return [{"role": first["role"], "parts": [file, *first["parts"]]}, *rest]
+
+
+def turns_key(turns):
+    return hashlib.sha256(json.dumps(turns, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class ContextCacheEntry:
+    def __init__(self, cached, model, ttl):
+        self.cached = cached
+        self.model = model
+        self.expiresAt = time.monotonic() + ttl
+
+
+class ContextCache:
+    """Keeps one Gemini cached context per (contract, model, preamble).
+
+    The contract and its static preamble are registered once; later calls
+    start their chat from the cached context and only send the new message.
+    Contracts the API refuses to cache (too small, or a model without context
+    caching) are remembered so they fall back to inline history right away.
+    Cache calls are retried and timed out like model calls; one that still
+    fails, or runs out of time, sends the contract inline this once.
+    """
+
+    def __init__(self, client, ttl=CONTEXT_CACHE_TTL, maxEntries=CONTEXT_CACHE_MAX_ENTRIES):
+        self.client = client
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.uncacheable = TTLCache(maxsize=1024, ttl=ttl)
+
+        self.hits = 0
+        self.creates = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.fallbacks = 0
+        self.lost = 0
+
+    async def model_for(self, modelName, file, turns):
+        """Returns a model bound to the cached context, or None to send inline."""
+        key = (file.name, modelName, turns_key(turns))
+        if key in self.uncacheable:
+            self.fallbacks += 1
+            return None
+
+        entry = self.entries.get(key)
+        if entry and entry.expiresAt > time.monotonic():
+            self.hits += 1
+            self.entries.move_to_end(key)
+            if entry.expiresAt - time.monotonic() < CONTEXT_CACHE_REFRESH_WINDOW:
+                await self.refresh(entry)
+            return entry.model
+        if entry:
+            del self.entries[key]
+
+        if key not in self.pending:
+            self.pending[key] = asyncio.ensure_future(
+                self.create(key, modelName, contract_turns(file, turns)))
+        try:
+            entry = await asyncio.shield(self.pending[key])
+        finally:
+            self.pending.pop(key, None)
+        return entry.model if entry else None
+
+    async def create(self, key, modelName, contents):
+        try:
+            cached = await call_with_retries(
+                CONTEXT_CACHE_BREAKER,
+                lambda timeout: self.client.create_cached_content(modelName, contents, self.ttl),
+                CONTEXT_CACHE_TIMEOUT)
+        except (CircuitOpenError, DeadlineExceededError, *TRANSIENT_ERRORS):
+            self.fallbacks += 1
+            return None
+        except Exception:
+            cached = None
+        if cached is None:
+            self.uncacheable[key] = True
+            self.fallbacks += 1
+            return None
+
+        entry = ContextCacheEntry(cached, self.client.cached_model(cached), self.ttl)
+        self.entries[key] = entry
+        self.creates += 1
+        while len(self.entries) > self.maxEntries:
+            _, evicted = self.entries.popitem(last=False)
+            self.evictions += 1
+            asyncio.ensure_future(self.delete(evicted))
+        return entry
+
+    async def keep_alive(self, model):
+        """Refreshes the cached context a live chat's model is bound to.
+
+        Returns False when that context was evicted or has expired, so the
+        chat has to be rebuilt. Models without a cached context are always
+        fine.
+        """
+        if getattr(model, "cached_content", None) is None:
+            return True
+        key = next((key for key, entry in self.entries.items() if entry.model is model), None)
+        entry = self.entries.get(key)
+        if entry is None or entry.expiresAt <= time.monotonic():
+            self.entries.pop(key, None)
+            self.lost += 1
+            return False
+        self.entries.move_to_end(key)
+        if entry.expiresAt - time.monotonic() < CONTEXT_CACHE_REFRESH_WINDOW:
+            await self.refresh(entry)
+        return True
+
+    def discard(self, model):
+        """Forgets the cached context of a model the API says is gone."""
+        for key, entry in list(self.entries.items()):
+            if entry.model is model:
+                del self.entries[key]
+                self.lost += 1
+
+    async def refresh(self, entry):
+        try:
+            await call_with_retries(
+                CONTEXT_CACHE_BREAKER,
+                lambda timeout: self.client.refresh_cached_content(entry.cached, self.ttl),
+                CONTEXT_CACHE_TIMEOUT)
+        except Exception:
+            return
+        entry.expiresAt = time.monotonic() + self.ttl
+        self.refreshes += 1
+
+    async def delete(self, entry):
+        try:
+            await call_with_retries(
+                CONTEXT_CACHE_BREAKER,
+                lambda timeout: self.client.delete_cached_content(entry.cached),
+                CONTEXT_CACHE_TIMEOUT)
+        except Exception:
+            pass
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "creates": self.creates,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "fallbacks": self.fallbacks,
+            "lost": self.lost,
+        }
@@ -0,0 +1,287 @@
+"""Local stand-in for the Gemini backend, used by the benchmarks.
+
+FakeClient keeps the real GeminiClient call path (scheduler, context cache,
+metrics) and only swaps the models and the File API: every message is
+answered after a delay with a sample built from the call's response_schema.
+FaultyClient also fails or hangs on some calls, to exercise retries and
+circuit breakers. sample_contract() builds a small PDF to upload.
+"""
+import asyncio
+import json
+import random
+import time
+import types
+import uuid
+
+from google.api_core import exceptions as api_exceptions
+
+from gemini_client import GeminiClient, CONTEXT_CACHE_MODELS
+from model_scheduler import estimate_tokens
+
+
+# Replies the fake gives for fields whose empty sample would be useless.
+FAKE_VALUES = {
+    "weeklyChargesBands": ["0.01 - 19,429.99", "19,430.00 - 37,779.99",
+                           "37,780.00 - 56,129.99", "56,130.00+"],
+}
+
+
+def sample_from_schema(schema):
+    if schema["type"] == "object":
+        return {key: FAKE_VALUES.get(key) or sample_from_schema(value)
+                for key, value in schema["properties"].items()}
+    if schema["type"] == "array":
+        return [sample_from_schema(schema["items"])]
+    return "50.00%"
+
+
+# One line of text per page; the headings are the ones section_index looks
+# for, so uploads of the sample take the page-subset path.
+SAMPLE_PAGES = [f"General terms and conditions, page {i + 1}" for i in range(24)]
+SAMPLE_PAGES[1] = "Weekly Charges Band 0.01 - 19,429.99 19,430.00 - 37,779.99 56,130.00+"
+SAMPLE_PAGES[5] = "Next Day Air Letter Package 2nd Day Air 3 Day Select"
+SAMPLE_PAGES[8] = "Accessorial charges Delivery Area Surcharge Residential"
+SAMPLE_PAGES[12] = "Portfolio Tier Incentive Ground Commercial"
+SAMPLE_PAGES[15] = "Addendum 1 Commodity Tier"
+SAMPLE_PAGES[19] = "UPS Worldwide Express International Incentives Off Effective Rates"
+
+
+def sample_contract(tag=""):
+    """A valid multi-page contract PDF; a `tag` makes its bytes unique."""
+    pages = [*SAMPLE_PAGES[:-1], f"{SAMPLE_PAGES[-1]} {tag}".strip()]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages))).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer << /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class FakeFile:
+    state = types.SimpleNamespace(name="ACTIVE")
+
+    def __init__(self):
+        # A fresh name per run so the result cache never short-circuits the calls.
+        self.name = f"files/{uuid.uuid4().hex}"
+
+
+def count_files(content):
+    if isinstance(content, FakeFile):
+        return 1
+    if isinstance(content, dict):
+        return count_files(content.get("parts", []))
+    if isinstance(content, (list, tuple)):
+        return sum(count_files(part) for part in content)
+    return 0
+
+
+class FakeCachedContent:
+    def __init__(self, model, contents):
+        self.model = model
+        self.contents = contents
+
+
+CHAT_REPLY = "The contract lists a 61% discount on Next Day Air packages. " * 8
+STREAM_CHUNKS = 8
+
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeChatSession:
+    def __init__(self, fake, history, cached=None, model=None):
+        self.fake = fake
+        self.model = model
+        self.history = history or []
+        self.cached = cached
+
+    def tokens(self, content):
+        fake = self.fake
+        return (estimate_tokens(content)
+                + count_files(content) * fake.contract_tokens)
+
+    async def send_message_async(self, content, generation_config=None, stream=False, **kwargs):
+        fake = self.fake
+        fake.calls += 1
+        uncached = self.tokens(self.history) + self.tokens(content)
+        fake.input_tokens += uncached
+        if self.cached:
+            fake.cached_tokens += self.tokens(self.cached.contents)
+
+        text, latency, usage = fake.reply(self, content, generation_config)
+
+        # Time to first token grows with the prompt the model has to process.
+        firstToken = latency + uncached / 1000 * fake.prefill_per_1k
+        fake.first_token_times.append(firstToken)
+
+        fake.output_tokens += estimate_tokens(text)
+        if stream:
+            return FakeStream(self, content, text, firstToken, latency)
+
+        if fake.blocking:
+            # Mimics the old synchronous send_message: the event loop is stuck.
+            time.sleep(firstToken)
+        else:
+            await asyncio.sleep(firstToken)
+        self.append(content, text)
+        return FakeResponse(text, usage)
+
+    def append(self, content, text):
+        self.history = [*self.history, {"role": "user", "parts": [content]},
+                        {"role": "model", "parts": [text]}]
+
+    def rewind(self):
+        pass
+
+
+class FakeStream(FakeResponse):
+    """Streams the reply in STREAM_CHUNKS pieces spread over the latency.
+
+    The last chunk arrives when a buffered reply would have.
+    """
+
+    def __init__(self, chat_session, content, text, duration, latency):
+        super().__init__(text)
+        self.chat_session = chat_session
+        self.content = content
+        self.duration = duration
+        self.latency = latency
+
+    async def __aiter__(self):
+        step = self.latency / STREAM_CHUNKS
+        size = -(-len(self.text) // STREAM_CHUNKS)
+        for i in range(0, len(self.text), size):
+            await asyncio.sleep(self.duration - self.latency + step if i == 0 else step)
+            yield types.SimpleNamespace(parts=[True], text=self.text[i:i + size])
+        self.chat_session.append(self.content, self.text)
+
+
+class FakeModel:
+    def __init__(self, fake, name, cached=None):
+        self.fake = fake
+        self.model_name = f"models/{name}"
+        self.cached = cached
+        self.cached_content = cached
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self.fake, history, self.cached, self)
+
+
+class FakeClient(GeminiClient):
+    """GeminiClient whose models answer locally after a fixed delay."""
+
+    def __init__(self, latency, blocking=False, contextCaching=False,
+                 contractTokens=0, prefillPer1k=0.0):
+        self.latency = latency
+        self.blocking = blocking
+        self.contract_tokens = contractTokens
+        self.prefill_per_1k = prefillPer1k
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.first_token_times = []
+        self.files = {}
+        super().__init__(contextCaching=contextCaching)
+
+    def configure(self, api_key=None):
+        pass
+
+    def reply(self, chat_session, content, generation_config):
+        """Returns (text, latency, usage_metadata) for one message."""
+        schema = (generation_config or {}).get("response_schema")
+        text = json.dumps(sample_from_schema(schema)) if schema else CHAT_REPLY
+        return text, self.latency, None
+
+    def model(self, name):
+        return FakeModel(self, name)
+
+    async def create_cached_content(self, modelName, contents, ttl):
+        if modelName not in CONTEXT_CACHE_MODELS:
+            return None
+        await asyncio.sleep(self.latency)
+        return FakeCachedContent(CONTEXT_CACHE_MODELS[modelName], contents)
+
+    def cached_model(self, cached):
+        return FakeModel(self, cached.model.removeprefix("models/"), cached)
+
+    async def refresh_cached_content(self, cached, ttl):
+        pass
+
+    async def delete_cached_content(self, cached):
+        pass
+
+    async def upload_file(self, file, mime_type, display_name=None):
+        await asyncio.sleep(self.latency)
+        uploaded = FakeFile()
+        self.files[uploaded.name] = uploaded
+        return uploaded
+
+    async def get_file(self, name):
+        return self.files.get(name)
+
+
+FAULTS = {
+    429: api_exceptions.TooManyRequests,
+    503: api_exceptions.ServiceUnavailable,
+}
+
+
+class FaultyClient(FakeClient):
+    """FakeClient whose models return 429s and 503s, hang, or go down.
+
+    `errorRate` is a fraction of calls, or a dict of fractions per model
+    name. A hung call takes `hangLatency` seconds, so it ends in a timeout.
+    Every call to a model in `down` fails with a 503.
+    """
+
+    def __init__(self, latency, errorRate=0.0, hangRate=0.0, hangLatency=60.0,
+                 down=(), seed=0, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.errorRate = errorRate
+        self.hangRate = hangRate
+        self.hangLatency = hangLatency
+        self.down = set(down)
+        self.random = random.Random(seed)
+        self.faults = {}
+
+    def error_rate(self, model):
+        if isinstance(self.errorRate, dict):
+            return self.errorRate.get(model, 0.0)
+        return self.errorRate
+
+    def fault(self, kind):
+        self.faults[kind] = self.faults.get(kind, 0) + 1
+
+    def reply(self, chat_session, content, generation_config):
+        model = chat_session.model.model_name.removeprefix("models/")
+        if model in self.down or self.random.random() < self.error_rate(model):
+            status = 503 if model in self.down else self.random.choice(list(FAULTS))
+            self.fault(status)
+            raise FAULTS[status](f"Injected {status} from {model}")
+
+        text, latency, usage = super().reply(chat_session, content, generation_config)
+        if self.random.random() < self.hangRate:
+            self.fault("hang")
+            latency = self.hangLatency
+        return text, latency, usage
@@ -1,71 +1,299 @@
 import os
-import google.generativeai as genai
-import dotenv
-import json
+import asyncio
+import time
+import hashlib
+import io
+import tempfile
 
-dotenv.load_dotenv()
+from starlette.datastructures import UploadFile
 
-genai.configure(api_key=os.getenv("API_KEY"))
+from gemini_client import get_client, generation_config, FLASH_MODEL
+from upload_cache import upload_cache, active_files
+from response_parser import request_table
+from table_schemas import with_schema
+from band_table import band_tables
+from prompts import prompts
+from section_index import SECTION_INDEX, split_contract, load_index, save_index
+from metrics import span, section_files
 
-model = genai.GenerativeModel("gemini-1.5-flash")
+FILE_ACTIVE_TIMEOUT = float(os.getenv("FILE_ACTIVE_TIMEOUT", "300"))
+FILE_POLL_INITIAL_DELAY = 0.5
+FILE_POLL_MAX_DELAY = 10
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+# Worked example for the band lookup; the contract is attached in front of it.
+BAND_TURNS = [
+    {
+        "role": "user",
+        "parts": [
+            """Use the attached contract to find the table. If there are multiple tables, use the first table. 
+
+                Requirements:
+                1. Analyze the weekly charges band ranges in the table
+                2. The first range has the minimum value as 0
+                3. Find the range where *16,856* falls
+                4. Match criteria: min value <= *16,856* <= max value
+                5. If no exact range is found, return the highest possible range
+
+                Output Format:
+                {{
+                    "weeklyChargesBand": "EXACT_RANGE_FOUND"
+                }}
+                """,
+        ],
+    },
+    {
+        "role": "model",
+        "parts": [
+            "```json\n{\n  \"weeklyChargesBand\": \"0.01 - 19,429.99\"\n}\n```"
+        ]
+    }
+]
+
+BAND = {"weeklyChargesBand": ""}
+band_config = with_schema(generation_config, BAND)
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+async def hash_upload(file):
+    """Hashes an UploadFile in fixed-size chunks and rewinds it.
+
+    The bytes stay in Starlette's spooled temp file, so memory per request is
+    bounded by the chunk size and oversized uploads are rejected before they
+    reach the File API.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise UploadTooLargeError(
+            f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadTooLargeError(
+                f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+        digest.update(chunk)
+    await file.seek(0)
+
+    return digest.hexdigest()
+
+
+async def copy_upload(file):
+    """Copies an UploadFile so it outlives the request, e.g. for a job.
+
+    Starlette closes the request's files once the response is sent.
+    """
+    copy = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            copy.close()
+            raise UploadTooLargeError(
+                f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+        copy.write(chunk)
+    copy.seek(0)
+
+    return UploadFile(copy, size=size, filename=file.filename, headers=file.headers)
+
+
+async def wait_for_file_active(fileName, timeout=None):
+    """Waits for the given file to be active.
+
+    Some files uploaded to the Gemini API need to be processed before they can be
+    used as prompt inputs. The status can be seen by querying the file's "state"
+    field.
+    """
+    file = (await wait_for_files_active([fileName], timeout))[fileName]
+    if isinstance(file, Exception):
+        raise file
+
+    return file
+
+
+async def wait_for_files_active(fileNames, timeout=None):
+    """Waits for several files at once and returns {fileName: file or error}.
+
+    All files still processing are polled together in one round, starting at
+    a sub-second interval and backing off exponentially up to
+    FILE_POLL_MAX_DELAY. Files already seen as ACTIVE are served from memory
+    until shortly before they expire (see upload_cache.ActiveFiles).
+    """
+    if timeout is None:
+        timeout = FILE_ACTIVE_TIMEOUT
+    deadline = time.monotonic() + timeout
+
+    results = {}
+    pending = []
+    for fileName in dict.fromkeys(fileNames):
+        cached = active_files.get(fileName)
+        if cached is not None:
+            results[fileName] = cached
+        else:
+            pending.append(fileName)
+
+    if pending:
+        with span("file_active"):
+            await poll_files(pending, results, deadline, timeout)
+
+    return results
+
+
+async def poll_files(pending, results, deadline, timeout):
+    """Polls the pending files until each is active, failed or timed out."""
+    delay = FILE_POLL_INITIAL_DELAY
+    while pending:
+        files = await asyncio.gather(
+            *(get_client().get_file(fileName) for fileName in pending),
+            return_exceptions=True)
+
+        processing = []
+        for fileName, file in zip(pending, files):
+            if isinstance(file, Exception):
+                results[fileName] = file
+            elif not file:
+                results[fileName] = Exception(f"File {fileName} not found")
+            elif file.state.name == "PROCESSING":
+                processing.append(fileName)
+            elif file.state.name != "ACTIVE":
+                results[fileName] = Exception(f"File {file.name} failed to process")
+            else:
+                active_files.remember(fileName, file)
+                results[fileName] = file
+        pending = processing
+
+        remaining = deadline - time.monotonic()
+        if pending and remaining <= 0:
+            for fileName in pending:
+                results[fileName] = Exception(
+                    f"File {fileName} still processing after {timeout}s")
+            break
+        if pending:
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, FILE_POLL_MAX_DELAY)
 
 
 async def handle_file_upload(file, weeklyChargesBand):
 
-    with open(file.filename, "wb") as f:
-        f.write(await file.read())
-
-    uploadedFile = genai.upload_file(
-        file.filename, mime_type=file.content_type)
-
-    os.remove(file.filename)
-
-    chat_session = model.start_chat(history=[
-        {
-            "role": "user",
-            "parts": [
-                uploadedFile,
-                """Use the attached contract to find the table. If there are multiple tables, use the first table. 
-
-                    Requirements:
-                    1. Analyze the weekly charges band ranges in the table
-                    2. The first range has the minimum value as 0
-                    3. Find the range where *16,856* falls
-                    4. Match criteria: min value <= *16,856* <= max value
-                    5. If no exact range is found, return the highest possible range
-
-                    Output Format:
-                    {{
-                        "weeklyChargesBand": "EXACT_RANGE_FOUND"
-                    }}
-                    """,
-            ],
-        },
-        {
-            "role": "model",
-            "parts": [
-                "```json\n{\n  \"weeklyChargesBand\": \"0.01 - 19,429.99\"\n}\n```"
-            ]
-        }
-    ])
-
-    response = chat_session.send_message(
-        f"""Use the attached contract to find the table. If there are multiple tables, use the first table.
-
-        Requirements:
-        1. Analyze the weekly charges band ranges in the table
-        2. The first range has the minimum value as 0
-        3. Find the range where *{weeklyChargesBand}* falls
-        4. Match criteria: min value <= *{weeklyChargesBand}* <= max value
-        5. If no exact range is found, return the highest possible rang
-        Output Format:
-        {{
-            "weeklyChargesBand": "EXACT_RANGE_FOUND"
-        }}
-        """
-    )
-
-    exactWeeklyBandRange = json.loads(response.text.replace(
-        "```json\n", "").replace("\n```", ""))["weeklyChargesBand"]
+    uploadedFile = await upload_contract(file)
+
+    exactWeeklyBandRange, _ = await asyncio.gather(
+        resolve_band(uploadedFile, weeklyChargesBand),
+        index_sections(file, uploadedFile))
 
     return uploadedFile, exactWeeklyBandRange
+
+
+async def upload_contract(file):
+    """Uploads a contract to the File API, reusing an earlier identical upload."""
+
+    digest = await hash_upload(file)
+
+    uploadedFile = None
+    cachedFileName = upload_cache.lookup(digest)
+    if cachedFileName:
+        try:
+            uploadedFile = await wait_for_file_active(cachedFileName)
+        except Exception:
+            # The remote file was deleted or failed; upload it again.
+            upload_cache.forget(digest)
+
+    if uploadedFile is None:
+        with span("upload"):
+            uploadedFile = await get_client().upload_file(
+                file.file, mime_type=file.content_type, display_name=file.filename)
+
+        upload_cache.remember(digest, uploadedFile.name)
+
+    return uploadedFile
+
+
+async def resolve_band(uploadedFile, weeklyChargesBand):
+    """Finds the contract's weekly charges band that contains the given amount.
+
+    The contract's band table is extracted once and searched locally; the
+    model is only asked per amount when the table cannot be read.
+    """
+    with span("band"):
+        try:
+            return await band_tables.resolve(uploadedFile, weeklyChargesBand)
+        except Exception:
+            return await lookup_band_with_model(uploadedFile, weeklyChargesBand)
+
+
+async def lookup_band_with_model(uploadedFile, weeklyChargesBand):
+
+    response = await request_table(
+        FLASH_MODEL, uploadedFile,
+        prompts.render("band_lookup", weeklyChargesBand=weeklyChargesBand),
+        BAND, band_config, turns=BAND_TURNS, table="band_lookup")
+
+    return response["weeklyChargesBand"]
+
+
+async def index_sections(file, uploadedFile):
+    """Uploads the page subset of each module next to a contract.
+
+    The index is built once per contract and cached; later uploads of the
+    same contract only re-upload subsets that are missing or whose remote
+    files have expired. Contracts that cannot be read as a PDF are indexed
+    as having no subsets. A subset that fails to upload is left out, and
+    its module reads the full contract until a later upload retries it.
+    """
+    if not SECTION_INDEX:
+        return
+
+    index = load_index(uploadedFile)
+    if index is not None and all(
+            upload_cache.peek(index["digests"].get(module, ""))
+            for module, pages in index["sections"].items() if pages):
+        return
+
+    with span("sections"):
+        try:
+            index, subsets = await asyncio.to_thread(split_contract, file.file, index)
+        except Exception:
+            save_index(uploadedFile, {"pages": 0, "sections": {}, "digests": {}})
+            return
+
+        digests = await asyncio.gather(
+            *(upload_subset(file, module, data) for module, data in subsets.items()),
+            return_exceptions=True)
+        index["digests"] = {module: digest for module, digest in zip(subsets, digests)
+                            if not isinstance(digest, BaseException)}
+        save_index(uploadedFile, index)
+
+
+async def upload_subset(file, module, data):
+    """Uploads a module's subset of a contract, reusing an identical earlier upload."""
+    digest = hashlib.sha256(data).hexdigest()
+    if not upload_cache.peek(digest):
+        subset = await get_client().upload_file(
+            io.BytesIO(data), mime_type="application/pdf",
+            display_name=f"{file.filename} ({module})")
+        upload_cache.remember(digest, subset.name)
+    return digest
+
+
+async def section_file(file, module):
+    """The page subset of a contract that `module` reads, or the contract itself."""
+    index = load_index(file) if SECTION_INDEX else None
+    digest = index and index.get("digests", {}).get(module)
+    fileName = digest and upload_cache.peek(digest)
+    if fileName:
+        try:
+            subset = await wait_for_file_active(fileName)
+            section_files.inc(module=module, source="subset")
+            return subset
+        except Exception:
+            upload_cache.forget(digest)
+
+    section_files.inc(module=module, source="contract")
+    return file
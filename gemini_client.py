@@ -0,0 +1,259 @@
+import os
+import asyncio
+import datetime
+import dotenv
+import contextlib
+from contextlib import asynccontextmanager
+
+os.environ["GRPC_VERBOSITY"] = "ERROR"
+os.environ["GLOG_minloglevel"] = "2"
+
+import google.generativeai as genai
+
+from model_scheduler import scheduler, estimate_tokens
+from context_cache import ContextCache, contract_turns
+from metrics import span, model_calls, model_tokens
+from resilience import call_with_retries, within_deadline, breakers, CircuitOpenError, TRANSIENT_ERRORS
+
+FLASH_MODEL = "gemini-1.5-flash"
+PRO_MODEL = "gemini-2.0-flash-exp"
+
+MODEL_TIMEOUT = float(os.getenv("MODEL_TIMEOUT", "120"))
+CONTEXT_CACHING = os.getenv("CONTEXT_CACHING", "1") == "1"
+
+# Context caching needs an explicit model version; models missing here (such
+# as the experimental 2.0 flash) always get the contract inline.
+CONTEXT_CACHE_MODELS = {
+    FLASH_MODEL: "models/gemini-1.5-flash-002",
+}
+
+generation_config = {
+    "temperature": 0,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+
+def model_label(chat_session):
+    name = getattr(getattr(chat_session, "model", None), "model_name", None) or "unknown"
+    return name.removeprefix("models/")
+
+
+def record_tokens(model, estimated, response):
+    """Counts a call's tokens and charges the scheduler for the real usage."""
+    usage = getattr(response, "usage_metadata", None)
+    inputTokens = getattr(usage, "prompt_token_count", 0) or estimated
+    outputTokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(response)
+    model_tokens.inc(inputTokens, model=model, direction="input")
+    model_tokens.inc(outputTokens, model=model, direction="output")
+    scheduler.record_usage(estimated, getattr(usage, "total_token_count", 0))
+
+
+async def cancel_stream(response):
+    """Stops a streamed reply that the consumer abandoned.
+
+    The SDK does not expose cancellation. It keeps only the async generator
+    that api_core's wrapped gRPC call returns from __aiter__, and that call
+    is the generator's `self`. Cancelling the call stops generation
+    server-side; the generator is then closed either way.
+    """
+    iterator = getattr(response, "_iterator", None)
+    frame = getattr(iterator, "ag_frame", None)
+    call = frame.f_locals.get("self") if frame is not None else None
+    cancel = getattr(call, "cancel", None)
+    if cancel:
+        cancel()
+    aclose = getattr(iterator, "aclose", None)
+    if aclose:
+        with contextlib.suppress(Exception):
+            await aclose()
+
+
+class GeminiClient:
+    """The one place that talks to google.generativeai.
+
+    Models are created once per name and reused, so every module shares the
+    same underlying channel. Timeouts and retries are applied here and every
+    model call is admitted through the shared model_scheduler.
+
+    Subclasses can override configure() and model() to swap the backend while
+    keeping the call path.
+    """
+
+    def __init__(self, api_key=None, timeout=MODEL_TIMEOUT, contextCaching=CONTEXT_CACHING):
+        self.timeout = timeout
+        self.models = {}
+        self.context_cache = ContextCache(self) if contextCaching else None
+        self.configure(api_key)
+
+    def configure(self, api_key=None):
+        dotenv.load_dotenv()
+        genai.configure(api_key=api_key or os.getenv("API_KEY"))
+
+    def model(self, name):
+        if name not in self.models:
+            self.models[name] = genai.GenerativeModel(name)
+        return self.models[name]
+
+    def start_chat(self, modelName, history=None):
+        return self.model(modelName).start_chat(history=history or [])
+
+    async def start_contract_chat(self, modelName, file, turns, history=None):
+        """Starts a chat about a contract that opens with a static preamble.
+
+        When the contract and preamble are in the context cache the chat only
+        carries `history`; otherwise the contract is sent inline.
+        """
+        if self.context_cache:
+            cachedModel = await self.context_cache.model_for(modelName, file, turns)
+            if cachedModel is not None:
+                return cachedModel.start_chat(history=history or [])
+        return self.start_chat(modelName, contract_turns(file, turns) + (history or []))
+
+    async def context_alive(self, chat_session):
+        """Keeps a chat's cached context alive; False once it is gone."""
+        if self.context_cache is None:
+            return True
+        return await self.context_cache.keep_alive(chat_session.model)
+
+    def forget_context(self, chat_session):
+        if self.context_cache:
+            self.context_cache.discard(chat_session.model)
+
+    async def create_cached_content(self, modelName, contents, ttl):
+        cacheModel = CONTEXT_CACHE_MODELS.get(modelName)
+        if cacheModel is None:
+            return None
+        return await asyncio.to_thread(
+            genai.caching.CachedContent.create, model=cacheModel,
+            contents=contents, ttl=datetime.timedelta(seconds=ttl))
+
+    def cached_model(self, cached):
+        return genai.GenerativeModel.from_cached_content(cached)
+
+    async def refresh_cached_content(self, cached, ttl):
+        await asyncio.to_thread(cached.update, ttl=datetime.timedelta(seconds=ttl))
+
+    async def delete_cached_content(self, cached):
+        await asyncio.to_thread(cached.delete)
+
+    async def send_message(self, chat_session, content, generation_config=None, **kwargs):
+        """Sends one message, retrying transient errors (see resilience).
+
+        Each attempt first takes a model_scheduler slot. Only the model call
+        itself is timed out, so a call queued behind others is never counted
+        as a slow or failing model.
+        """
+        model = model_label(chat_session)
+        estimated = estimate_tokens(chat_session.history) + estimate_tokens(content)
+        return await call_with_retries(
+            model,
+            lambda timeout: self.send_once(
+                chat_session, content, generation_config, timeout, model, estimated, **kwargs),
+            self.timeout,
+            slot=lambda: self.slot(model, estimated))
+
+    @asynccontextmanager
+    async def slot(self, model, estimated):
+        with span("scheduler_wait", model):
+            await within_deadline(scheduler.acquire(estimated), f"a {model} slot")
+        try:
+            yield
+        finally:
+            scheduler.release()
+
+    async def send_once(self, chat_session, content, generation_config, timeout,
+                        model, estimated, **kwargs):
+        try:
+            with span("model_call", model):
+                response = await chat_session.send_message_async(
+                    content, generation_config=generation_config,
+                    request_options={"timeout": timeout}, **kwargs)
+        except Exception:
+            model_calls.inc(model=model, outcome="error")
+            raise
+
+        model_calls.inc(model=model, outcome="ok")
+        record_tokens(model, estimated, response)
+        return response
+
+    async def stream_message(self, chat_session, content, generation_config=None, **kwargs):
+        """Yields the reply text chunk by chunk as the model produces it.
+
+        If the consumer stops early (e.g. the HTTP client went away) the
+        stream is cancelled and the unfinished turn is dropped from the chat.
+        A stream is not retried, since chunks may already have been sent,
+        but it goes through the model's circuit breaker.
+        """
+        model = model_label(chat_session)
+        breaker = breakers.get(model)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for {model} is open")
+        trial = breaker.state == "half_open"
+        estimated = estimate_tokens(chat_session.history) + estimate_tokens(content)
+        with span("scheduler_wait", model):
+            await scheduler.acquire(estimated)
+        try:
+            with span("model_stream", model):
+                response = await chat_session.send_message_async(
+                    content, generation_config=generation_config, stream=True,
+                    request_options={"timeout": self.timeout}, **kwargs)
+                completed = False
+                try:
+                    async for chunk in response:
+                        if chunk.parts:
+                            yield chunk.text
+                    completed = True
+                finally:
+                    if not completed:
+                        await cancel_stream(response)
+                        chat_session.rewind()
+        except (GeneratorExit, asyncio.CancelledError):
+            breaker.abandon(trial)
+            model_calls.inc(model=model, outcome="cancelled")
+            raise
+        except TRANSIENT_ERRORS:
+            breaker.record(False, trial)
+            model_calls.inc(model=model, outcome="error")
+            raise
+        except Exception:
+            breaker.abandon(trial)
+            model_calls.inc(model=model, outcome="error")
+            raise
+        finally:
+            scheduler.release()
+
+        breaker.record(True, trial)
+        model_calls.inc(model=model, outcome="ok")
+        record_tokens(model, estimated, response)
+
+    async def upload_file(self, file, mime_type, display_name=None):
+        def upload(timeout):
+            # A failed attempt may have read part of the file.
+            file.seek(0)
+            return asyncio.to_thread(
+                genai.upload_file, file, mime_type=mime_type, display_name=display_name)
+        return await call_with_retries("files", upload)
+
+    async def get_file(self, name):
+        return await call_with_retries(
+            "files", lambda timeout: asyncio.to_thread(genai.get_file, name))
+
+
+client = None
+
+
+def get_client():
+    """Returns the shared client, creating it on first use."""
+    global client
+    if client is None:
+        client = GeminiClient()
+    return client
+
+
+def set_client(newClient):
+    """Swaps the shared client, e.g. for a fake backend in benchmarks."""
+    global client
+    client = newClient
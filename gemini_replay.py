@@ -0,0 +1,230 @@
+"""Record real Gemini replies for a contract and replay them offline.
+
+Record once, with an API key, every reply the pipeline gets for a contract:
+
+    python gemini_replay.py contract.pdf --band 16856 --cassette cassettes/contract.jsonl \
+        --chat "What is the Next Day Air discount?"
+
+ReplayClient then answers the same messages from the cassette, with no
+network, after a latency drawn from a configurable distribution. Messages are
+matched on the model, the text of the conversation so far, the new message
+and the response_schema; the contract itself is not part of the key, so one
+cassette holds one contract.
+"""
+import os
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import statistics
+import time
+import types
+
+from gemini_client import GeminiClient, CONTEXT_CACHE_MODELS
+from fake_gemini import FakeClient
+
+CACHE_MODEL_NAMES = {name.removeprefix("models/"): model for model, name in CONTEXT_CACHE_MODELS.items()}
+
+
+def base_model(name):
+    """Model name without the "models/" prefix or a context-cache version."""
+    name = (name or "").removeprefix("models/")
+    return CACHE_MODEL_NAMES.get(name, name)
+
+
+def texts(content):
+    """The text parts of a message or conversation; files are left out."""
+    if isinstance(content, str):
+        return [content] if content else []
+    if isinstance(content, dict):
+        return texts(content.get("parts", []))
+    if isinstance(content, (list, tuple)):
+        return [text for part in content for text in texts(part)]
+    if hasattr(content, "parts"):
+        return texts(list(content.parts))
+    text = getattr(content, "text", None)
+    return [text] if isinstance(text, str) and text else []
+
+
+def message_key(modelName, conversation, content, generation_config):
+    schema = (generation_config or {}).get("response_schema")
+    payload = json.dumps([base_model(modelName), conversation, texts(content), schema],
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+def load_cassette(path):
+    records = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[record["key"]] = record
+    return records
+
+
+def parse_latency(spec, recorded=(), seed=None):
+    """Turns a latency spec into a function of the matched record.
+
+    fixed:S (or just S), uniform:MIN,MAX, lognormal:MEDIAN,SIGMA, or
+    recorded[:SCALE] to reuse the recorded latency; misses under
+    "recorded" get the median recorded latency.
+    """
+    rng = random.Random(seed)
+    kind, _, args = str(spec).partition(":")
+    values = [float(value) for value in args.split(",") if value]
+
+    if kind == "recorded":
+        scale = values[0] if values else 1.0
+        fallback = statistics.median(recorded) if recorded else 0.0
+        return lambda record: (record["latency"] if record else fallback) * scale
+    if kind == "fixed":
+        return lambda record: values[0]
+    if kind == "uniform":
+        return lambda record: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda record: rng.lognormvariate(math.log(values[0]), values[1])
+    return lambda record: float(kind)
+
+
+class RecordingClient(GeminiClient):
+    """The real client, appending every reply to a cassette file."""
+
+    def __init__(self, cassette, **kwargs):
+        self.cassette = open(cassette, "a", encoding="utf-8")
+        self.recorded = 0
+        super().__init__(**kwargs)
+
+    async def start_contract_chat(self, modelName, file, turns, history=None):
+        chat_session = await super().start_contract_chat(modelName, file, turns, history)
+        # A chat on a cached context does not carry the preamble in its history.
+        cached = getattr(chat_session.model, "cached_content", None)
+        chat_session.preamble = texts(turns) if cached else []
+        chat_session.recorded_model = modelName
+        return chat_session
+
+    def conversation(self, chat_session):
+        return getattr(chat_session, "preamble", []) + texts(chat_session.history)
+
+    async def send_message(self, chat_session, content, generation_config=None, **kwargs):
+        conversation = self.conversation(chat_session)
+        start = time.perf_counter()
+        response = await super().send_message(chat_session, content, generation_config, **kwargs)
+        self.record(chat_session, conversation, content, generation_config,
+                    response.text, time.perf_counter() - start, response.usage_metadata)
+        return response
+
+    async def stream_message(self, chat_session, content, generation_config=None, **kwargs):
+        conversation = self.conversation(chat_session)
+        start = time.perf_counter()
+        chunks = []
+        async for text in super().stream_message(chat_session, content, generation_config, **kwargs):
+            chunks.append(text)
+            yield text
+        self.record(chat_session, conversation, content, generation_config,
+                    "".join(chunks), time.perf_counter() - start, None)
+
+    def record(self, chat_session, conversation, content, generation_config, text, latency, usage):
+        modelName = getattr(chat_session, "recorded_model", None) or chat_session.model.model_name
+        schema = (generation_config or {}).get("response_schema")
+        self.cassette.write(json.dumps({
+            "key": message_key(modelName, conversation, content, generation_config),
+            "model": base_model(modelName),
+            "kind": "table" if schema else "chat",
+            "prompt": "\n".join(texts(content)),
+            "response": text,
+            "latency": round(latency, 4),
+            "input_tokens": getattr(usage, "prompt_token_count", 0),
+            "output_tokens": getattr(usage, "candidates_token_count", 0),
+        }, ensure_ascii=False) + "\n")
+        self.cassette.flush()
+        self.recorded += 1
+
+
+class ReplayClient(FakeClient):
+    """Answers from a cassette after a latency drawn from `latency`.
+
+    Messages missing from the cassette get a sample built from their
+    response_schema, like FakeClient, unless `strict` is set.
+    """
+
+    def __init__(self, cassette=None, latency="recorded", strict=False, seed=None, **kwargs):
+        self.records = load_cassette(cassette) if cassette else {}
+        recorded = [record["latency"] for record in self.records.values()]
+        self.latency_of = parse_latency(latency, recorded, seed)
+        self.strict = strict
+        self.hits = 0
+        self.misses = 0
+        kwargs.setdefault("contextCaching", True)
+        super().__init__(latency=0, **kwargs)
+
+    def reply(self, chat_session, content, generation_config):
+        cached = chat_session.cached.contents if chat_session.cached else []
+        key = message_key(chat_session.model.model_name, texts(cached) + texts(chat_session.history),
+                          content, generation_config)
+        record = self.records.get(key)
+        if record is None:
+            self.misses += 1
+            if self.strict:
+                raise KeyError(f"No recorded reply for {key}")
+            text, _, _ = super().reply(chat_session, content, generation_config)
+            return text, self.latency_of(None), None
+
+        self.hits += 1
+        usage = types.SimpleNamespace(
+            prompt_token_count=record["input_tokens"],
+            candidates_token_count=record["output_tokens"],
+            total_token_count=record["input_tokens"] + record["output_tokens"])
+        return record["response"], self.latency_of(record), usage
+
+    def chat_prompts(self):
+        return [record["prompt"] for record in self.records.values() if record["kind"] == "chat"]
+
+    def stats(self):
+        return {"records": len(self.records), "hits": self.hits, "misses": self.misses}
+
+
+async def record_contract(args):
+    from starlette.datastructures import Headers, UploadFile
+
+    from analysis import analyze_contract
+    from chat import handle_chat
+    from file_upload import handle_file_upload, wait_for_file_active
+    from gemini_client import set_client
+
+    client = RecordingClient(args.cassette)
+    set_client(client)
+
+    with open(args.pdf, "rb") as f:
+        upload = UploadFile(f, filename=os.path.basename(args.pdf),
+                            headers=Headers({"content-type": "application/pdf"}))
+        uploadedFile, exactWeeklyBandRange = await handle_file_upload(upload, args.band)
+    file = await wait_for_file_active(uploadedFile.name)
+
+    await analyze_contract(file, exactWeeklyBandRange)
+    for message in args.chat:
+        await handle_chat(file, message, [])
+
+    print(f"recorded {client.recorded} replies for {args.pdf} "
+          f"(band {exactWeeklyBandRange}) to {args.cassette}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf")
+    parser.add_argument("--band", required=True, help="weekly charges to analyse at")
+    parser.add_argument("--cassette", required=True)
+    parser.add_argument("--chat", action="append", default=[],
+                        help="a chat question to record; repeatable")
+    args = parser.parse_args()
+
+    # Every reply must come from the model, not from an earlier run's cache.
+    os.environ.setdefault("RESULT_CACHE_PATH", ":memory:")
+    os.makedirs(os.path.dirname(os.path.abspath(args.cassette)), exist_ok=True)
+    asyncio.run(record_contract(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Hedged model calls for tail latency.
+
+A table request that is still running after HEDGE_PERCENTILE of its recent
+latencies gets a duplicate. The first valid reply wins and the other call is
+cancelled. Duplicates are capped at HEDGE_MAX_RATIO of all calls, so extra
+quota use stays bounded even when the model slows down across the board.
+"""
+import os
+import asyncio
+import math
+import time
+from collections import deque
+
+from metrics import model_hedges, table_request_seconds
+
+HEDGING = os.getenv("HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.05"))
+# Calls of a table and model observed before it is hedged.
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class Hedger:
+    def __init__(self, enabled=HEDGING, hedgePercentile=HEDGE_PERCENTILE,
+                 maxRatio=HEDGE_MAX_RATIO, minSamples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW):
+        self.enabled = enabled
+        self.hedgePercentile = hedgePercentile
+        self.maxRatio = maxRatio
+        self.minSamples = minSamples
+        self.window = window
+        # Per (table, model): durations of single calls, which set the hedge
+        # delay, and of whole requests, hedged or not.
+        self.attempts = {}
+        self.requests = {}
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def delay(self, key):
+        """Seconds to wait before hedging, or None while it cannot be hedged."""
+        attempts = self.attempts.get(key)
+        if not self.enabled or not attempts or len(attempts) < self.minSamples:
+            return None
+        return percentile(attempts, self.hedgePercentile)
+
+    def observe(self, history, key, seconds):
+        history.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    async def call(self, table, model, attempt):
+        """Awaits `attempt()`, hedging it with a second `attempt()` when slow."""
+        key = (table, model)
+        self.calls += 1
+        delay = self.delay(key)
+        start = time.perf_counter()
+
+        tasks = [asyncio.ensure_future(self.timed(key, attempt))]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.hedges < self.maxRatio * self.calls:
+                    self.hedges += 1
+                    model_hedges.inc(table=table, model=model, outcome="fired")
+                    tasks.append(asyncio.ensure_future(self.timed(key, attempt)))
+
+            winner = await self.first_valid(tasks)
+            if winner is not tasks[0]:
+                self.wins += 1
+                model_hedges.inc(table=table, model=model, outcome="won")
+            return winner.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            elapsed = time.perf_counter() - start
+            self.observe(self.requests, key, elapsed)
+            table_request_seconds.observe(elapsed, table=table, model=model)
+
+    async def timed(self, key, attempt):
+        start = time.perf_counter()
+        try:
+            return await attempt()
+        finally:
+            # A cancelled loser is recorded too: its time so far is a lower
+            # bound, and leaving it out would drag the percentile down.
+            self.observe(self.attempts, key, time.perf_counter() - start)
+
+    async def first_valid(self, tasks):
+        """The first task to succeed, or the last to fail if none does."""
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task
+            if not pending:
+                return done.pop()
+
+    def stats(self):
+        tables = {}
+        for (table, model), durations in self.requests.items():
+            tables.setdefault(table, {})[model] = {
+                "recent": len(durations),
+                "p50": round(percentile(durations, 50), 3),
+                "p99": round(percentile(durations, 99), 3),
+                "hedge_after": self.delay((table, model)),
+            }
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.wins,
+            "tables": tables,
+        }
+
+
+hedger = Hedger()
@@ -1,25 +1,34 @@
-import os
-import google.generativeai as genai
 from fastapi import FastAPI, HTTPException, Form, File,  UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 import dotenv
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
-import time
+from typing import List, Optional
 
+dotenv.load_dotenv()
 
-from file_upload import handle_file_upload
+from file_upload import handle_file_upload, wait_for_file_active, copy_upload, UploadTooLargeError
 from discounts_domestic_air_accesorials import analyze_discounts_domestic_air_accesorials
 from discounts_domestic_ground import analyze_discounts_domestic_ground
 from discounts_international import analyze_discounts_international
-from chat import handle_chat
-import asyncio
-
-dotenv.load_dotenv()
-
-os.environ["GRPC_VERBOSITY"] = "ERROR"
-os.environ["GLOG_minloglevel"] = "2"
+from analysis import analyze_contract, stream_tables
+from analysis_jobs import analysis_jobs, check_callback_url
+from analysis_batch import analyze_batch, BATCH_MAX_CONTRACTS
+from chat import handle_chat, open_session, stream_chat
+from chat_sessions import chat_sessions
+from band_table import band_tables
+from prompts import prompts
+from model_router import router
+from hedging import hedger
+from resilience import breakers, start_deadline
+from band_sweep import sweep_contract, sweep_discounts
+from upload_cache import upload_cache, active_files
+from result_cache import result_cache
+from model_scheduler import scheduler, request_id
+from metrics import registry, request_timings, server_timing, SERVER_TIMING
+from gemini_client import get_client
+import json
+import uuid
 
 app = FastAPI()
 
@@ -33,11 +42,30 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def tag_request(request, call_next):
+    # Model calls are queued fairly per request id (see model_scheduler) and
+    # share one deadline (see resilience).
+    request_id.set(uuid.uuid4().hex)
+    start_deadline()
+    timings = {}
+    request_timings.set(timings)
+    response = await call_next(request)
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+
 class AnalysisRequestBody(BaseModel):
     fileName: str
     weeklyChargesBand: str
 
 
+class SweepRequestBody(BaseModel):
+    fileName: str
+    weeklyChargesBand: Optional[str] = None
+
+
 class ChatMessage(BaseModel):
     role: str
     content: str
@@ -46,33 +74,22 @@ class ChatMessage(BaseModel):
 class ChatRequestBody(BaseModel):
     fileName: str
     message: str
-    chat_history: List[ChatMessage]
+    chat_history: List[ChatMessage] = []
+    session_id: Optional[str] = None
 
 
-def wait_for_file_active(fileName):
-    """Waits for the given files to be active.
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    Some files uploaded to the Gemini API need to be processed before they can be
-    used as prompt inputs. The status can be seen by querying the file's "state"
-    field.
 
-    This implementation uses a simple blocking polling loop. Production code
-    should probably employ a more sophisticated approach.
-    """
-    print("Waiting for file processing...")
+def ndjson(event, data):
+    return json.dumps({"event": event, **data}) + "\n"
 
-    file = genai.get_file(fileName)
-    if not file:
-        raise Exception(f"File {fileName} not found")
-    while file.state.name == "PROCESSING":
-        print(".", end="", flush=True)
-        time.sleep(10)
-        file = genai.get_file(fileName)
-    if file.state.name != "ACTIVE":
-        raise Exception(f"File {file.name} failed to process")
-    print("...all files ready")
 
-    return file
+STREAM_FORMATS = {
+    "sse": (sse, "text/event-stream"),
+    "ndjson": (ndjson, "application/x-ndjson"),
+}
 
 
 @app.get("/health")
@@ -80,8 +97,81 @@ async def read_root():
     return {"message": "Hello World"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/admin/upload-cache")
+async def upload_cache_stats():
+    return {**upload_cache.stats(), "active_files": active_files.stats()}
+
+
+@app.get("/api/admin/result-cache")
+async def result_cache_stats():
+    return result_cache.stats()
+
+
+@app.delete("/api/admin/result-cache")
+async def purge_result_cache(module: Optional[str] = None):
+    return {"purged": result_cache.purge(module)}
+
+
+@app.get("/api/admin/model-scheduler")
+async def model_scheduler_stats():
+    return scheduler.stats()
+
+
+@app.get("/api/admin/analysis-jobs")
+async def analysis_job_stats():
+    return analysis_jobs.stats()
+
+
+@app.get("/api/admin/band-tables")
+async def band_table_stats():
+    return band_tables.stats()
+
+
+@app.get("/api/admin/model-router")
+async def model_router_stats():
+    return router.stats()
+
+
+@app.get("/api/admin/hedging")
+async def hedging_stats():
+    return hedger.stats()
+
+
+@app.get("/api/admin/circuit-breakers")
+async def circuit_breaker_stats():
+    return breakers.stats()
+
+
+@app.get("/api/admin/prompts")
+async def prompt_stats():
+    return prompts.stats()
+
+
+@app.get("/api/admin/chat-sessions")
+async def chat_session_stats():
+    return chat_sessions.stats()
+
+
+@app.get("/api/admin/context-cache")
+async def context_cache_stats():
+    context_cache = get_client().context_cache
+    return context_cache.stats() if context_cache else {"enabled": False}
+
+
 @app.post("/api/analyze")
-async def analyze(file: UploadFile = File(...), weeklyChargesBand: str = Form(...)):
+async def analyze(file: UploadFile = File(...), weeklyChargesBand: str = Form(...),
+                  stream: Optional[str] = None):
+    """Analyses a contract. With ?stream=ndjson or ?stream=sse every table
+    is sent as soon as it is parsed instead of in one response at the end.
+
+    Stream events: `band` (file_name, exactWeeklyBandRange), one `table`
+    per table (module, table, data), `error` per failed module, then `done`.
+    """
     try:
 
         if not file or not weeklyChargesBand:
@@ -92,45 +182,170 @@ async def analyze(file: UploadFile = File(...), weeklyChargesBand: str = Form(..
             raise HTTPException(
                 status_code=400, detail="Only PDF files are accepted.")
 
+        if stream and stream not in STREAM_FORMATS:
+            raise HTTPException(
+                status_code=400, detail=f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+
         uploadedFile, exactWeeklyBandRange = await handle_file_upload(file, weeklyChargesBand)
 
-        file = wait_for_file_active(uploadedFile.name)
+        file = await wait_for_file_active(uploadedFile.name)
 
-        results = await asyncio.gather(
-            analyze_discounts_domestic_air_accesorials(
-                file, exactWeeklyBandRange),
-            analyze_discounts_domestic_ground(file, exactWeeklyBandRange),
-            analyze_discounts_international(file, exactWeeklyBandRange)
-        )
+        if stream:
+            return stream_analysis(stream, file, uploadedFile.name, exactWeeklyBandRange)
 
-        domesticair, accesorials = results[0]
-        domesticground1, domesticground2, domesticground3 = results[1]
-        international1, international2, response5 = results[2]
+        discounts = await analyze_contract(file, exactWeeklyBandRange)
 
         return JSONResponse(status_code=200, content={"file_name": uploadedFile.name,
                                                       "exactWeeklyBandRange": exactWeeklyBandRange,
-                                                      "discounts": [
-                                                          {
-                                                              "domesticAir": domesticair,
-                                                              "accesorials": accesorials
-                                                          },
-                                                          {
-                                                              "domesticGround1": domesticground1,
-                                                              "domesticGround2":  domesticground2,
-                                                              "domesticGround3": domesticground3,
-                                                          },
-                                                          {
-                                                              "international1": international1,
-                                                              "international2":  international2,
-                                                              "response5": response5,
-                                                          }
-                                                      ]
+                                                      "discounts": discounts
                                                       })
 
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def stream_analysis(stream, file, fileName, exactWeeklyBandRange):
+    format_event, media_type = STREAM_FORMATS[stream]
+
+    async def events():
+        yield format_event("band", {
+            "file_name": fileName,
+            "exactWeeklyBandRange": exactWeeklyBandRange
+        })
+        async for module, table, value in stream_tables(file, exactWeeklyBandRange):
+            if table is None:
+                yield format_event("error", {"module": module, "error": str(value)})
+            else:
+                yield format_event("table", {"module": module, "table": table, "data": value})
+        yield format_event("done", {})
+
+    return StreamingResponse(events(), media_type=media_type, headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.post("/api/analyze/batch")
+async def analyze_portfolio(files: List[UploadFile] = File([]), fileNames: List[str] = Form([]),
+                            weeklyChargesBands: List[str] = Form(...)):
+    """Analyses several contracts in one request.
+
+    Send new PDFs as repeated `files` and already uploaded contracts as
+    repeated `fileNames`, with one `weeklyChargesBands` value per contract
+    (files first, then fileNames). Each result carries its own status.
+    """
+    try:
+
+        count = len(files) + len(fileNames)
+        if not count or len(weeklyChargesBands) != count:
+            raise HTTPException(
+                status_code=400, detail="One weeklyChargesBands value is required per contract.")
+
+        if count > BATCH_MAX_CONTRACTS:
+            raise HTTPException(
+                status_code=400, detail=f"At most {BATCH_MAX_CONTRACTS} contracts per batch.")
+
+        if any(file.content_type != 'application/pdf' for file in files):
+            raise HTTPException(
+                status_code=400, detail="Only PDF files are accepted.")
+
+        batch = await analyze_batch(files, fileNames, weeklyChargesBands)
+
+        return JSONResponse(status_code=200, content=batch)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/analyze/sweep")
+async def analyze_sweep(body: SweepRequestBody):
+    """Extracts the tables of every weekly charges band of a contract.
+
+    Band-dependent tables come back column-wise under `tables` (`cells` ×
+    `bands`). With weeklyChargesBand the `discounts` of that band are sliced
+    out as well, in the same shape as /api/analyze.
+    """
+    try:
+
+        if not body.fileName:
+            return JSONResponse(status_code=400, content={
+                "error": "fileName is required"
+            })
+
+        file = await wait_for_file_active(body.fileName)
+
+        sweep = await sweep_contract(file)
+
+        content = {"file_name": file.name, **sweep}
+        if body.weeklyChargesBand:
+            exactWeeklyBandRange = (await band_tables.get(file)).resolve(body.weeklyChargesBand)
+            content["exactWeeklyBandRange"] = exactWeeklyBandRange
+            content["discounts"] = sweep_discounts(sweep, exactWeeklyBandRange)
+
+        return JSONResponse(status_code=200, content=content)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/analyze/jobs")
+async def submit_analysis_job(file: UploadFile = File(...), weeklyChargesBand: str = Form(...),
+                              callbackUrl: Optional[str] = Form(None)):
+    """Queues an analysis and returns its job id right away.
+
+    Poll GET /api/analyze/jobs/{job_id}; per-module tables appear under
+    `modules` as they finish and `discounts` is set once the job is done.
+    """
+    try:
+
+        if not file or not weeklyChargesBand:
+            raise HTTPException(
+                status_code=400, detail="File and weeklyChargesBand are required.")
+
+        if file.content_type != 'application/pdf':
+            raise HTTPException(
+                status_code=400, detail="Only PDF files are accepted.")
+
+        # Before copying, so a rejected callbackUrl leaves nothing behind.
+        if callbackUrl:
+            check_callback_url(callbackUrl)
+
+        upload = await copy_upload(file)
+        try:
+            job = await analysis_jobs.submit(upload, weeklyChargesBand, callbackUrl)
+        except BaseException:
+            await upload.close()
+            raise
+
+        return JSONResponse(status_code=202, content={
+            "job_id": job["job_id"],
+            "status": job["status"]
+        })
+
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @app.post("/api/chat")
 async def chat(body: ChatRequestBody):
     try:
@@ -140,15 +355,63 @@ async def chat(body: ChatRequestBody):
                 "error": "fileName and weeklyChargesBand are required"
             })
 
-        file = wait_for_file_active(body.fileName)
+        file = await wait_for_file_active(body.fileName)
+
+        response, session_id = await handle_chat(
+            file, body.message, body.chat_history, body.session_id)
+
+        return JSONResponse(status_code=200, content={
+            "response": response,
+            "session_id": session_id
+        })
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(body: ChatRequestBody):
+    """Same as /api/chat, but sends the reply as Server-Sent Events.
+
+    Events: `session` with the session_id, one `message` per chunk of text,
+    then `done`, or `error` if generation failed midway. Closing the
+    connection cancels the model call.
+    """
+    try:
+
+        if not body.fileName or not body.message:
+            return JSONResponse(status_code=400, content={
+                "error": "fileName and message are required"
+            })
 
-        response = await handle_chat(file, body.message, body.chat_history)
+        file = await wait_for_file_active(body.fileName)
 
-        return JSONResponse(status_code=200, content={"response": response})
+        session_id, entry = await open_session(
+            file, body.chat_history, body.session_id)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def events():
+        yield sse("session", {"session_id": session_id})
+        try:
+            async for text in stream_chat(entry, body.message):
+                yield sse("message", {"text": text})
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+            return
+        yield sse("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.delete("/api/chat/{session_id}")
+async def end_chat(session_id: str):
+    return {"deleted": chat_sessions.delete(session_id)}
+
 
 @app.post("/api/upload-file")
 async def upload_file(file: UploadFile = File(...), weeklyChargesBand: str = Form(...)):
@@ -166,6 +429,8 @@ async def upload_file(file: UploadFile = File(...), weeklyChargesBand: str = For
 
         return JSONResponse(status_code=200, content={"file_name": uploadedFile.name, "exactWeeklyBandRange": exactWeeklyBandRange})
 
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -179,7 +444,7 @@ async def discounts_domestic_air_accesorials(body: AnalysisRequestBody):
                 "error": "fileName and weeklyChargesBand are required"
             })
 
-        file = wait_for_file_active(body.fileName)
+        file = await wait_for_file_active(body.fileName)
 
         domesticair, accesorials = await analyze_discounts_domestic_air_accesorials(file, body.weeklyChargesBand)
 
@@ -201,7 +466,7 @@ async def discounts_domestic_ground(body: AnalysisRequestBody):
                 "error": "fileName and weeklyChargesBand are required"
             })
 
-        file = wait_for_file_active(body.fileName)
+        file = await wait_for_file_active(body.fileName)
 
         domesticground1, domesticground2, domesticground3 = await analyze_discounts_domestic_ground(file, body.weeklyChargesBand)
 
@@ -224,7 +489,7 @@ async def discounts_international(body: AnalysisRequestBody):
                 "error": "fileName and weeklyChargesBand are required"
             })
 
-        file = wait_for_file_active(body.fileName)
+        file = await wait_for_file_active(body.fileName)
 
         international1, international2, response5 = await analyze_discounts_international(file, body.weeklyChargesBand)
 
@@ -0,0 +1,158 @@
+"""Stage timings, token counts and retries, exposed in Prometheus text format.
+
+Code wraps each stage in `span(stage, model)`. Every span feeds the
+`contract_stage_duration_seconds` histogram and, while an HTTP request is
+being served, that request's timing breakdown for the Server-Timing header.
+"""
+import os
+import contextvars
+import time
+from contextlib import contextmanager
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Set per HTTP request in main; maps stage -> [total seconds, count].
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelNames=()):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelNames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labelNames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelNames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelNames)
+        series = self.series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            for bound, count in zip(self.buckets, series["buckets"]):
+                labels = format_labels(self.labelNames + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.labelNames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series['count']}")
+            labels = format_labels(self.labelNames, key)
+            lines.append(f"{self.name}_sum{labels} {series['sum']}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labelNames=()):
+        metric = Counter(name, help, labelNames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelNames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelNames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "contract_stage_duration_seconds",
+    "Time spent per pipeline stage (upload, file_active, band, sections, scheduler_wait, model_call, parse).",
+    ["stage", "model"])
+model_calls = registry.counter(
+    "model_calls_total", "Model calls by model and outcome.", ["model", "outcome"])
+model_tokens = registry.counter(
+    "model_tokens_total", "Model tokens by model and direction (input or output).",
+    ["model", "direction"])
+model_retries = registry.counter(
+    "model_retries_total", "Tables re-requested after an unusable reply.", ["model"])
+model_call_retries = registry.counter(
+    "model_call_retries_total", "Calls retried after a transient error, by breaker name and error.",
+    ["name", "error"])
+breaker_transitions = registry.counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes, by name and new state.",
+    ["name", "state"])
+model_escalations = registry.counter(
+    "model_escalations_total", "Tables escalated to a stronger model.",
+    ["table", "from_model", "to_model"])
+model_hedges = registry.counter(
+    "model_hedges_total", "Duplicate table requests fired after a slow call, and how many won.",
+    ["table", "model", "outcome"])
+table_request_seconds = registry.histogram(
+    "table_request_duration_seconds",
+    "Time to get one table from one model, including any hedged duplicate.",
+    ["table", "model"])
+prompts_over_budget = registry.counter(
+    "prompts_over_budget_total", "Prompts rendered past their template's token budget.", ["prompt"])
+section_files = registry.counter(
+    "contract_section_files_total",
+    "Files attached by extraction modules, by module and source (subset or contract).",
+    ["module", "source"])
+
+
+@contextmanager
+def span(stage, model=""):
+    """Times a block as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage, model=model)
+        timings = request_timings.get()
+        if timings is not None:
+            total = timings.setdefault(stage, [0.0, 0])
+            total[0] += elapsed
+            total[1] += 1
+
+
+def server_timing(timings):
+    """Formats a request's stage timings as a Server-Timing header value.
+
+    Concurrent stages (such as model calls) are summed, so the total of a
+    stage can exceed the request's wall-clock time.
+    """
+    return ", ".join(
+        f'{stage};dur={total * 1000:.1f};desc="{count}x"'
+        for stage, (total, count) in timings.items())
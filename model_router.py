@@ -0,0 +1,158 @@
+"""Routes each table to the cheapest model that answers it well.
+
+A table is asked of the models in MODEL_LADDER order, cheapest first, and
+escalated to the next one only when the reply fails schema validation or
+looks implausible (fewer than ROUTER_MIN_FILLED of the cells the template
+leaves empty were answered). A cell answered null is a valid "not in this
+contract", so tables that are often legitimately empty are not escalated;
+tables that cannot be empty set a minimum share of actual values in
+ROUTER_MIN_VALUES. Recent outcomes and latencies per
+table and model decide where a table starts: a model is skipped while it
+succeeds too rarely, or while starting there is slower on average than
+going straight to the next model. Skipped models are still probed now and
+then, so a table can move back down the ladder.
+"""
+import os
+from collections import deque
+
+from gemini_client import FLASH_MODEL, PRO_MODEL
+from metrics import model_escalations
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "10"))
+ROUTER_MIN_SUCCESS = float(os.getenv("ROUTER_MIN_SUCCESS", "0.7"))
+ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", "20"))
+ROUTER_MIN_FILLED = float(os.getenv("ROUTER_MIN_FILLED", "0.5"))
+# Per table, the share of answer cells that must hold a value, not null.
+ROUTER_MIN_VALUES = {
+    "band_lookup": ROUTER_MIN_FILLED,
+    "band_table": ROUTER_MIN_FILLED,
+}
+
+# Cheapest and fastest first.
+MODEL_LADDER = [FLASH_MODEL, PRO_MODEL]
+
+
+def answer_cells(value, template):
+    """Yields the reply's value for each cell the template leaves empty.
+
+    Cells the template pre-fills (row labels such as "Weight Range") are not
+    answers and are skipped. Cells missing from the reply yield "".
+    """
+    if isinstance(template, dict):
+        value = value if isinstance(value, dict) else {}
+        for key, child in template.items():
+            yield from answer_cells(value.get(key, ""), child)
+    elif isinstance(template, list):
+        for item in value if isinstance(value, list) else []:
+            yield from answer_cells(item, template[0])
+    elif template == "":
+        yield value
+
+
+def share(cells, test):
+    return sum(map(test, cells)) / len(cells) if cells else 0.0
+
+
+def filled_share(value, template):
+    """Share of a reply's answer cells holding a value, 0 when it has none."""
+    return share(list(answer_cells(value, template)), lambda cell: cell not in (None, ""))
+
+
+def answered_share(value, template):
+    """Share of a reply's answer cells filled or explicitly null."""
+    return share(list(answer_cells(value, template)), lambda cell: cell != "")
+
+
+def has_values(value, template, table=None):
+    """Whether a parsed table is answered well enough to be kept."""
+    return (answered_share(value, template) >= ROUTER_MIN_FILLED
+            and filled_share(value, template) >= ROUTER_MIN_VALUES.get(table, 0.0))
+
+
+class RouteStats:
+    """Recent outcomes and latencies of one model on one table."""
+
+    def __init__(self, window=ROUTER_WINDOW):
+        self.outcomes = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+
+    def record(self, ok, latency):
+        self.calls += 1
+        self.outcomes.append(ok)
+        self.latencies.append(latency)
+
+    def success_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 1.0
+
+    def latency(self):
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "success_rate": round(self.success_rate(), 3),
+            "mean_latency": round(self.latency(), 3),
+        }
+
+
+class ModelRouter:
+    def __init__(self, ladder=MODEL_LADDER):
+        self.ladder = list(ladder)
+        self.routes = {}
+        self.requests = {}
+        self.escalations = {}
+
+    def route_stats(self, table, model):
+        return self.routes.setdefault((table, model), RouteStats())
+
+    def start(self, table):
+        """Index in the ladder of the model a table is sent to first."""
+        start = 0
+        while start < len(self.ladder) - 1:
+            cheap = self.route_stats(table, self.ladder[start])
+            strong = self.route_stats(table, self.ladder[start + 1])
+            if len(cheap.outcomes) < ROUTER_MIN_SAMPLES:
+                break
+            rate = cheap.success_rate()
+            # Starting cheap costs its latency plus, on failure, the stronger
+            # model's; starting strong costs only the latter.
+            slower = strong.outcomes and cheap.latency() > rate * strong.latency()
+            if rate >= ROUTER_MIN_SUCCESS and not slower:
+                break
+            start += 1
+        return start
+
+    def models_for(self, table):
+        """The models to try for a table, in order."""
+        count = self.requests[table] = self.requests.get(table, 0) + 1
+        start = self.start(table)
+        if start and count % ROUTER_PROBE_EVERY == 0:
+            start -= 1
+        return self.ladder[start:]
+
+    def record(self, table, model, ok, latency):
+        self.route_stats(table, model).record(ok, latency)
+
+    def escalate(self, table, fromModel, toModel):
+        self.escalations[table] = self.escalations.get(table, 0) + 1
+        model_escalations.inc(table=table, from_model=fromModel, to_model=toModel)
+
+    def stats(self):
+        tables = {}
+        for (table, model), route in self.routes.items():
+            tables.setdefault(table, {"route": self.ladder[self.start(table)], "models": {}})
+            tables[table]["models"][model] = route.stats()
+        for table, count in self.escalations.items():
+            tables.setdefault(table, {})["escalations"] = count
+        return {
+            "enabled": MODEL_ROUTING,
+            "ladder": self.ladder,
+            "escalations": sum(self.escalations.values()),
+            "tables": tables,
+        }
+
+
+router = ModelRouter()
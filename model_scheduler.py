@@ -0,0 +1,168 @@
+import os
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+MAX_CONCURRENT_MODEL_CALLS = int(os.getenv("MAX_CONCURRENT_MODEL_CALLS", "32"))
+MODEL_REQUESTS_PER_MINUTE = float(os.getenv("MODEL_REQUESTS_PER_MINUTE", "1000"))
+MODEL_TOKENS_PER_MINUTE = float(os.getenv("MODEL_TOKENS_PER_MINUTE", "4000000"))
+
+# Set per HTTP request in main so model calls can be queued fairly per request.
+request_id = contextvars.ContextVar("request_id", default="background")
+
+
+def estimate_tokens(content):
+    """Rough prompt size: Gemini averages about four characters per token."""
+    if isinstance(content, str):
+        return len(content) // 4
+    if isinstance(content, dict):
+        return estimate_tokens(content.get("parts", []))
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(part) for part in content)
+    if hasattr(content, "parts"):
+        return estimate_tokens(list(content.parts))
+    text = getattr(content, "text", None)
+    if isinstance(text, str):
+        return len(text) // 4
+    return 0
+
+
+class TokenBucket:
+    def __init__(self, perMinute):
+        self.capacity = perMinute
+        self.rate = perMinute / 60
+        self.tokens = perMinute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken; 0 when the bucket is disabled."""
+        if not self.capacity:
+            return 0
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.tokens -= amount
+
+
+class Waiter:
+    def __init__(self, future, tokens):
+        self.future = future
+        self.tokens = tokens
+        self.enqueuedAt = time.monotonic()
+
+
+class ModelCallScheduler:
+    """Admits model calls under an in-flight cap and RPM/TPM budgets.
+
+    Waiting calls are queued per request and admitted round-robin, so one
+    large analysis cannot starve the calls of other requests.
+    """
+
+    def __init__(self, maxInFlight=MAX_CONCURRENT_MODEL_CALLS,
+                 requestsPerMinute=MODEL_REQUESTS_PER_MINUTE,
+                 tokensPerMinute=MODEL_TOKENS_PER_MINUTE):
+        self.maxInFlight = maxInFlight
+        self.requests = TokenBucket(requestsPerMinute)
+        self.tokens = TokenBucket(tokensPerMinute)
+        self.queues = OrderedDict()
+        self.inFlight = 0
+        self.timer = None
+
+        self.admitted = 0
+        self.maxQueueDepth = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def dispatch(self):
+        while self.queues and self.inFlight < self.maxInFlight:
+            requestId, queue = next(iter(self.queues.items()))
+            waiter = queue[0]
+            if waiter.future.done():
+                # Cancelled while queued.
+                self.pop(requestId, queue)
+                continue
+
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens))
+            if delay > 0:
+                if self.timer is None:
+                    self.timer = asyncio.get_running_loop().call_later(delay, self.on_timer)
+                return
+
+            self.pop(requestId, queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.inFlight += 1
+
+            waited = time.monotonic() - waiter.enqueuedAt
+            self.admitted += 1
+            self.totalWait += waited
+            self.maxWait = max(self.maxWait, waited)
+            waiter.future.set_result(None)
+
+    def pop(self, requestId, queue):
+        queue.popleft()
+        # Rotate so the next admission goes to a different request.
+        del self.queues[requestId]
+        if queue:
+            self.queues[requestId] = queue
+
+    def on_timer(self):
+        self.timer = None
+        self.dispatch()
+
+    async def acquire(self, tokens):
+        waiter = Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self.queues.setdefault(request_id.get(), deque()).append(waiter)
+        self.maxQueueDepth = max(self.maxQueueDepth, self.queue_depth())
+        self.dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.inFlight -= 1
+        self.dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens):
+        await self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_usage(self, estimated, actual):
+        """Charges the TPM budget for the difference once real usage is known."""
+        if actual:
+            self.tokens.take(actual - estimated)
+
+    def stats(self):
+        return {
+            "in_flight": self.inFlight,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.maxQueueDepth,
+            "admitted": self.admitted,
+            "avg_wait_seconds": self.totalWait / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.maxWait,
+        }
+
+
+scheduler = ModelCallScheduler()
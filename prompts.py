@@ -0,0 +1,190 @@
+"""Versioned prompt templates, compiled once at startup.
+
+Templates use `string.Template` placeholders (`$weeklyChargesBand`), so JSON
+and other braces in a prompt need no escaping; a literal dollar sign is
+written `$$`. Rendering checks that every parameter is bound. Every template
+is rendered once with its sample parameters at import and in the tests, so a
+prompt that outgrows its token budget fails there rather than in production.
+At runtime, request-supplied parameters can still push a prompt past its
+budget; such renders are counted, not refused. A template's `version`
+hashes its text and is meant to be part of any cache key built on its
+output.
+"""
+import hashlib
+import json
+from string import Template
+
+from model_scheduler import estimate_tokens
+from metrics import prompts_over_budget
+from table_schemas import ACCESORIALS
+
+
+class PromptBudgetError(ValueError):
+    pass
+
+
+def bind(match, bound):
+    """Substitutes one placeholder if it is bound, leaving `$$` escapes intact."""
+    name = match.group("named") or match.group("braced")
+    if name in bound:
+        return str(bound[name]).replace("$", "$$")
+    return match.group()
+
+
+class PromptTemplate:
+    def __init__(self, name, text, budget, sample=None, **bound):
+        """`bound` parameters are substituted now; the rest at render time."""
+        self.name = name
+        self.template = Template(Template.pattern.sub(
+            lambda match: bind(match, bound), text))
+        if not self.template.is_valid():
+            raise ValueError(f"Prompt {name} has an invalid placeholder")
+        self.parameters = sorted(set(self.template.get_identifiers()))
+        self.budget = budget
+        self.sample = sample or {}
+        self.version = hashlib.sha256(self.template.template.encode()).hexdigest()[:12]
+        self.renders = 0
+        self.overBudget = 0
+        self.maxTokens = 0
+
+    def render(self, **parameters):
+        missing = set(self.parameters) - set(parameters)
+        unknown = set(parameters) - set(self.parameters)
+        if missing or unknown:
+            raise TypeError(f"Prompt {self.name} takes {self.parameters}, "
+                            f"got {sorted(parameters)}")
+
+        prompt = self.template.substitute(parameters)
+        tokens = estimate_tokens(prompt)
+        if tokens > self.budget:
+            self.overBudget += 1
+            prompts_over_budget.inc(prompt=self.name)
+        self.renders += 1
+        self.maxTokens = max(self.maxTokens, tokens)
+        return prompt
+
+    def within_budget(self, prompt):
+        """Returns the prompt's estimated tokens, raising if over budget."""
+        tokens = estimate_tokens(prompt)
+        if tokens > self.budget:
+            raise PromptBudgetError(
+                f"Prompt {self.name} is {tokens} tokens, over its budget of {self.budget}")
+        return tokens
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "parameters": self.parameters,
+            "budget": self.budget,
+            "renders": self.renders,
+            "over_budget": self.overBudget,
+            "max_tokens": self.maxTokens,
+        }
+
+
+class PromptRegistry:
+    def __init__(self):
+        self.templates = {}
+
+    def register(self, name, text, budget, sample=None, **bound):
+        if name in self.templates:
+            raise ValueError(f"Prompt {name} is already registered")
+        template = PromptTemplate(name, text, budget, sample, **bound)
+        self.templates[name] = template
+        return template
+
+    def __getitem__(self, name):
+        return self.templates[name]
+
+    def render(self, name, **parameters):
+        return self.templates[name].render(**parameters)
+
+    def versions(self, *names):
+        """Combined version of the named templates, or of all of them."""
+        names = names or sorted(self.templates)
+        return hashlib.sha256(
+            "".join(self.templates[name].version for name in names).encode()).hexdigest()[:12]
+
+    def check(self):
+        """Renders every template with its sample; raises if one is over budget."""
+        for template in self.templates.values():
+            template.within_budget(template.template.substitute(template.sample))
+
+    def stats(self):
+        return {name: template.stats() for name, template in self.templates.items()}
+
+
+prompts = PromptRegistry()
+
+BAND_SAMPLE = {"weeklyChargesBand": "142,000.00 - 999,999,999.99"}
+SWEEP_SAMPLE = {
+    "what": "both tables from the portfolio tier incentive table",
+    "bands": json.dumps([f"{i * 20000:,}.00 - {i * 20000 + 19999:,}.99" for i in range(20)]),
+}
+
+prompts.register(
+    "domestic_air",
+    "Use the attached contract to fill the domestic air table. the weekly charges band is $weeklyChargesBand.",
+    budget=60, sample=BAND_SAMPLE)
+
+# The accesorials do not depend on the weekly band.
+prompts.register(
+    "accesorials",
+    "Use the attached contract to fill the current UPS. All the accesorials and incentives are listed in the attached contract. if current_ups not found for a particular accesorial charge return null. return one row for each of these accesorial charges, in this order: $accesorials",
+    budget=500, accesorials=json.dumps(ACCESORIALS, ensure_ascii=False))
+
+prompts.register(
+    "portfolio_tier",
+    "Use the attached contract to populate both tables. Focus only on the weekly charge bands ($$) range of $weeklyChargesBand from the portfolio tier incentive table. only get the values from the portfolio tier incentive table for the correct weekly charge bands.\n"
+    "domesticGround1 is the incentive for each ground service. domesticGround2 is the incentives off effective rates for each weight range.",
+    budget=150, sample=BAND_SAMPLE)
+
+prompts.register(
+    "domestic_ground_3",
+    "Use the attached contract to fill the table. there should be 2 rows. commodity tier is in addendum 1. the weekly charges band is $weeklyChargesBand.",
+    budget=70, sample=BAND_SAMPLE)
+
+prompts.register(
+    "international_1",
+    "Use the attached contract to fill the international service level table. The weekly charges bands ($$) is $weeklyChargesBand. (please return values related to this alone).",
+    budget=80, sample=BAND_SAMPLE)
+
+# The incentives off effective rates do not depend on the weekly band.
+prompts.register(
+    "international_2",
+    "Use the attached contract to fill the international incentives off effective rates table.",
+    budget=40)
+
+prompts.register(
+    "sweep",
+    "Use the attached contract to fill $what, for every weekly charges band ($$) at once. Every empty cell is a list with one value per band, in this order: $bands.",
+    budget=400, sample=SWEEP_SAMPLE)
+
+prompts.register(
+    "band_table",
+    'Use the attached contract to find the weekly charges band ranges ($$). If there are multiple tables, use the first table. List every range in the order it appears, exactly as written, e.g. "0.01 - 19,429.99".',
+    budget=80)
+
+prompts.register(
+    "band_lookup",
+    """Use the attached contract to find the table. If there are multiple tables, use the first table.
+
+Requirements:
+1. Analyze the weekly charges band ranges in the table
+2. The first range has the minimum value as 0
+3. Find the range where *$weeklyChargesBand* falls
+4. Match criteria: min value <= *$weeklyChargesBand* <= max value
+5. If no exact range is found, return the highest possible range
+Output Format:
+{
+    "weeklyChargesBand": "EXACT_RANGE_FOUND"
+}
+""",
+    budget=180, sample=BAND_SAMPLE)
+
+prompts.register(
+    "table_retry",
+    "The previous reply could not be used ($error). Return the complete table again as valid JSON and nothing else.",
+    budget=200, sample={"error": '$.INTERNATIONAL SERVICE LEVEL.Export.UPS Worldwide Express®.Letter is missing "Current UPS"'})
+
+prompts.check()
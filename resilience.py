@@ -0,0 +1,228 @@
+"""Retries within a deadline budget, and a circuit breaker per model.
+
+Transient errors (429, 500, 503, 504 and timeouts) are retried with
+full-jitter exponential backoff. Every HTTP request, job and batch contract
+gets a deadline: each attempt's timeout is capped by the time left, and a
+retry is not started if its backoff would run past the deadline.
+
+Each model has a circuit breaker. When too many of its recent calls fail
+transiently it opens, and calls fail fast with CircuitOpenError, so tables
+can go to another model, until BREAKER_COOLDOWN has passed. The next call
+is then let through as the only trial, and every other call keeps failing
+fast until it settles: success closes the breaker and failure opens it
+again. A trial that ends without an answer (cancelled, or a non-transient
+error) frees the slot for the next call, and so does one still running
+after BREAKER_COOLDOWN.
+"""
+import os
+import asyncio
+import contextvars
+import contextlib
+import random
+import time
+from collections import deque
+
+from google.api_core import exceptions as api_exceptions
+
+from metrics import model_call_retries, breaker_transitions
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "300"))
+
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+TRANSIENT_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    TimeoutError,
+)
+
+# Monotonic time by which the current request's model calls must finish.
+deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+def start_deadline(seconds=REQUEST_DEADLINE):
+    """Gives the current context (a request, job or batch contract) its budget."""
+    deadline.set(time.monotonic() + seconds)
+
+
+def time_left():
+    end = deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+async def within_deadline(awaitable, what):
+    """Awaits a local wait, such as a scheduler slot, for at most the time left.
+
+    Running out of time here raises DeadlineExceededError rather than a
+    TimeoutError, so it is never mistaken for a slow model.
+    """
+    left = time_left()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except TimeoutError:
+        raise DeadlineExceededError(f"No time left while waiting for {what}") from None
+
+
+def backoff(attempt):
+    """Full jitter: a random delay up to the exponential backoff cap."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=BREAKER_WINDOW, minCalls=BREAKER_MIN_CALLS,
+                 errorRate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.minCalls = minCalls
+        self.errorRate = errorRate
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.state = "closed"
+        self.openedAt = 0.0
+        self.trialStartedAt = None
+        self.rejected = 0
+
+    def trial_due(self):
+        """Whether the next call would be let through as a trial."""
+        now = time.monotonic()
+        if self.state == "open":
+            return now - self.openedAt >= self.cooldown
+        return (self.state == "half_open"
+                and (self.trialStartedAt is None or now - self.trialStartedAt >= self.cooldown))
+
+    def available(self):
+        """Whether a call would be let through, without counting it."""
+        return self.state == "closed" or self.trial_due()
+
+    def allow(self):
+        """Whether to make a call. Right after True, a half-open state means
+        the call is the trial."""
+        if self.state == "closed":
+            return True
+        if not self.trial_due():
+            self.rejected += 1
+            return False
+        if self.state == "open":
+            self.transition("half_open")
+        self.trialStartedAt = time.monotonic()
+        return True
+
+    def abandon(self, trial):
+        """Ends a call that neither succeeded nor failed transiently."""
+        if trial and self.state == "half_open":
+            self.trialStartedAt = None
+
+    def record(self, ok, trial=False):
+        if self.state == "half_open":
+            # Calls admitted before the breaker opened do not settle it.
+            if trial:
+                self.transition("closed" if ok else "open")
+            return
+        if self.state == "open":
+            return
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if (self.state == "closed" and len(self.outcomes) >= self.minCalls
+                and failures / len(self.outcomes) >= self.errorRate):
+            self.transition("open")
+
+    def transition(self, state):
+        self.state = state
+        self.trialStartedAt = None
+        if state == "open":
+            self.openedAt = time.monotonic()
+        self.outcomes.clear()
+        breaker_transitions.inc(name=self.name, state=state)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "recent_calls": len(self.outcomes),
+            "recent_failures": self.outcomes.count(False),
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakers:
+    def __init__(self):
+        self.breakers = {}
+
+    def get(self, name):
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    def available(self, names):
+        """The names whose breaker would let a call through, in order."""
+        return [name for name in names if self.get(name).available()]
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
+
+
+breakers = CircuitBreakers()
+
+
+async def call_with_retries(name, attempt, timeout=None, slot=None):
+    """Awaits `attempt(timeout)`, retrying transient errors.
+
+    `name` picks the circuit breaker (a model, or "files"). `slot`, if
+    given, returns an async context manager entered before each attempt,
+    such as a model_scheduler slot; the wait for it is not part of the
+    attempt. Each attempt's timeout is `timeout` capped by the time left
+    before the deadline once the slot is held; with neither, the attempt is
+    not timed out.
+    """
+    breaker = breakers.get(name)
+    for retry in range(RETRY_MAX_ATTEMPTS):
+        left = time_left()
+        if left is not None and left <= 0:
+            raise DeadlineExceededError(f"No time left for a call to {name}")
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for {name} is open")
+        trial = breaker.state == "half_open"
+
+        try:
+            async with slot() if slot else contextlib.nullcontext():
+                left = time_left()
+                if left is not None and left <= 0:
+                    raise DeadlineExceededError(f"No time left for a call to {name}")
+                limits = [limit for limit in (timeout, left) if limit is not None]
+                attemptTimeout = min(limits) if limits else None
+
+                if attemptTimeout is None:
+                    result = await attempt(None)
+                else:
+                    result = await asyncio.wait_for(attempt(attemptTimeout), attemptTimeout)
+        except TRANSIENT_ERRORS as e:
+            breaker.record(False, trial)
+            delay = backoff(retry)
+            left = time_left()
+            if retry + 1 == RETRY_MAX_ATTEMPTS or (left is not None and delay >= left):
+                raise
+            model_call_retries.inc(name=name, error=type(e).__name__)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.abandon(trial)
+            raise
+
+        breaker.record(True, trial)
+        return result
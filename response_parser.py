@@ -0,0 +1,197 @@
+import json
+import re
+import time
+
+from gemini_client import get_client
+from context_cache import EXTRACTION_TURNS
+from metrics import span, model_retries
+from prompts import prompts
+from model_router import router, has_values, MODEL_ROUTING, MODEL_LADDER
+from hedging import hedger
+from resilience import breakers, CircuitOpenError, TRANSIENT_ERRORS
+from upload_cache import active_files, FILE_GONE_ERRORS
+
+
+class TableParseError(Exception):
+    pass
+
+
+CLOSERS = {"{": "}", "[": "]"}
+
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+
+
+def json_candidates(text):
+    """Yields each balanced JSON object or array in a model reply, in order.
+
+    Prose, markdown fences and text between candidates are skipped; brackets
+    inside a candidate do not start another one. If the reply is cut off, the
+    missing closing brackets are appended to the last candidate.
+    """
+    start = next_start(text, 0)
+    while start is not None:
+        stack = []
+        inString = False
+        escaped = False
+        for i in range(start, len(text)):
+            char = text[i]
+            if inString:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    inString = False
+            elif char == '"':
+                inString = True
+            elif char in CLOSERS:
+                stack.append(CLOSERS[char])
+            elif stack and char == stack[-1]:
+                stack.pop()
+                if not stack:
+                    yield text[start:i + 1]
+                    start = next_start(text, i + 1)
+                    break
+        else:
+            closing = '"' if inString else ""
+            yield text[start:].rstrip().rstrip(",") + closing + "".join(reversed(stack))
+            return
+
+
+def next_start(text, pos):
+    starts = [i for i in (text.find("{", pos), text.find("[", pos)) if i >= 0]
+    return min(starts) if starts else None
+
+
+def replace_outside_strings(text, replacements):
+    parts = re.split(r'("(?:[^"\\]|\\.)*")', text)
+    pattern = re.compile(r"\b(" + "|".join(replacements) + r")\b")
+    for i in range(0, len(parts), 2):
+        parts[i] = pattern.sub(lambda m: replacements[m.group(1)], parts[i])
+    return "".join(parts)
+
+
+def repair_json(text):
+    """Fixes the defects model replies most often have."""
+    text = text.translate(SMART_QUOTES)
+    text = TRAILING_COMMA.sub(r"\1", text)
+    return replace_outside_strings(text, PYTHON_LITERALS)
+
+
+def validate_table(value, template, path="$"):
+    """Checks that a parsed reply has the shape of its table template."""
+    if isinstance(template, dict):
+        if not isinstance(value, dict):
+            raise TableParseError(f"{path} should be an object")
+        for key, child in template.items():
+            if key not in value:
+                raise TableParseError(f"{path} is missing \"{key}\"")
+            validate_table(value[key], child, f"{path}.{key}")
+    elif isinstance(template, list):
+        if not isinstance(value, list):
+            raise TableParseError(f"{path} should be an array")
+        for i, item in enumerate(value):
+            validate_table(item, template[0], f"{path}[{i}]")
+    elif value is not None and not isinstance(value, (str, int, float)):
+        raise TableParseError(f"{path} should be a single value")
+
+
+def load_json(candidate):
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        try:
+            return json.loads(repair_json(candidate))
+        except json.JSONDecodeError as e:
+            raise TableParseError(f"invalid JSON: {e}")
+
+
+def parse_table(text, template):
+    """Returns the first JSON value in the reply that has the table's shape.
+
+    Candidates that do not parse (e.g. "{see below}" in the prose) or have the
+    wrong shape are skipped. If none fits, the first shape error is raised,
+    or the first JSON error when no candidate parsed at all.
+    """
+    jsonError = shapeError = None
+    for candidate in json_candidates(text):
+        try:
+            value = load_json(candidate)
+        except TableParseError as e:
+            jsonError = jsonError or e
+            continue
+        try:
+            validate_table(value, template)
+        except TableParseError as e:
+            shapeError = shapeError or e
+            continue
+        return value
+    raise shapeError or jsonError or TableParseError("no JSON object found in the reply")
+
+
+async def request_table(modelName, file, prompt, template, generation_config=None,
+                        turns=EXTRACTION_TURNS, table=None):
+    """Asks for one table about a contract and parses the reply.
+
+    With a `table` name and routing on, the model router picks the models to
+    try, cheapest first, instead of `modelName`. A reply that cannot be
+    parsed or leaves too many of the template's empty cells unanswered (see
+    model_router.has_values) is escalated to the next model; the last model
+    gets one follow-up in its session so it can see what it got wrong, and
+    its answer is kept even if every cell is empty. Slow calls may be hedged
+    with a duplicate (see hedging). Models whose circuit breaker is open are
+    skipped, falling back to the rest of MODEL_LADDER, and a model that keeps
+    failing transiently is escalated from like a bad reply (see resilience).
+    """
+    models = router.models_for(table) if table and MODEL_ROUTING else [modelName]
+    models = breakers.available(models) or breakers.available(MODEL_LADDER) or models
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        start = time.perf_counter()
+        try:
+            value = await hedger.call(table or "", model, lambda: ask_table(
+                model, file, prompt, template, generation_config, turns, retry=last))
+        except TableParseError:
+            if table:
+                router.record(table, model, False, time.perf_counter() - start)
+            if last:
+                raise
+        except FILE_GONE_ERRORS:
+            # The contract expired or was deleted; wait_for_file_active must
+            # look it up again rather than hand out the stale file.
+            active_files.forget(file.name)
+            raise
+        except (CircuitOpenError, *TRANSIENT_ERRORS):
+            # Retries ran out, or the breaker opened while this table waited.
+            if last:
+                raise
+        else:
+            ok = has_values(value, template, table)
+            if table:
+                router.record(table, model, ok, time.perf_counter() - start)
+            if ok or last:
+                return value
+
+        router.escalate(table, model, models[i + 1])
+
+
+async def ask_table(modelName, file, prompt, template, generation_config, turns, retry=True):
+    """Asks one model for a table, in a chat of its own."""
+    client = get_client()
+    chat_session = await client.start_contract_chat(modelName, file, turns)
+    response = await client.send_message(
+        chat_session, prompt, generation_config=generation_config)
+    try:
+        with span("parse", modelName):
+            return parse_table(response.text, template)
+    except TableParseError as e:
+        if not retry:
+            raise
+        model_retries.inc(model=modelName)
+        response = await client.send_message(
+            chat_session, prompts.render("table_retry", error=str(e)),
+            generation_config=generation_config)
+        with span("parse", modelName):
+            return parse_table(response.text, template)
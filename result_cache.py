@@ -0,0 +1,124 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.sqlite3")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+
+
+class ResultCache:
+    """Persistent cache of extraction results with least-recently-used eviction."""
+
+    def __init__(self, path=RESULT_CACHE_PATH, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, module TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, used_at REAL NOT NULL)")
+
+    def get(self, key):
+        value = self.peek(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def peek(self, key):
+        """Like get, without counting a hit or miss."""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            self.conn.execute(
+                "UPDATE results SET used_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def set(self, key, module, value):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, module, json.dumps(value), now, now))
+            evicted = self.conn.execute(
+                "DELETE FROM results WHERE key NOT IN ("
+                "SELECT key FROM results ORDER BY used_at DESC LIMIT ?)",
+                (self.maxsize,)).rowcount
+            self.evictions += evicted
+
+    def purge(self, module=None):
+        with self.lock, self.conn:
+            if module:
+                return self.conn.execute(
+                    "DELETE FROM results WHERE module = ?", (module,)).rowcount
+            return self.conn.execute("DELETE FROM results").rowcount
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT module, COUNT(*) FROM results GROUP BY module").fetchall()
+        return {
+            "entries": sum(count for _, count in rows),
+            "entries_by_module": dict(rows),
+            "max_entries": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+result_cache = ResultCache()
+
+
+def contract_key(file):
+    """Content hash of an uploaded contract, falling back to its file name."""
+    sha256_hash = getattr(file, "sha256_hash", None)
+    if sha256_hash:
+        return sha256_hash.hex() if isinstance(sha256_hash, bytes) else str(sha256_hash)
+    return file.name
+
+
+def prompt_version(func, *templates):
+    """Short hash of the extraction function's module and its prompt templates.
+
+    The whole module is hashed so table templates defined next to the
+    function also invalidate its cached results when they change, and so
+    does a new version of any prompt template it renders.
+    """
+    source = inspect.getsource(inspect.getmodule(func))
+    versions = "".join(template.version for template in templates)
+    return hashlib.sha256((source + versions).encode()).hexdigest()[:12]
+
+
+def cached_result(module, *templates):
+    """Caches an analyze_* coroutine on (contract, band, module, prompt version)."""
+    def decorator(func):
+        version = prompt_version(func, *templates)
+
+        @functools.wraps(func)
+        async def wrapper(file, weeklyChargesBand):
+            key = "|".join([contract_key(file), weeklyChargesBand.strip(),
+                            module, version])
+            cached = result_cache.get(key)
+            if cached is not None:
+                return tuple(cached)
+
+            result = await func(file, weeklyChargesBand)
+            result_cache.set(key, module, result)
+            return result
+
+        wrapper.prompt_version = version
+        return wrapper
+    return decorator
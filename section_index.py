@@ -0,0 +1,119 @@
+"""Splits contracts into pages and indexes the sections each module reads.
+
+At upload time the text of every page is searched for each module's
+headings. The matching pages, plus the page after each one where tables
+continue, are written to a smaller PDF and uploaded next to the contract.
+Modules then attach their subset instead of the whole contract. The index is
+cached with the contract hash; a module whose headings are not found, or
+whose subset would not be much smaller, keeps the full contract.
+"""
+import os
+import hashlib
+import io
+import re
+
+from pypdf import PdfReader, PdfWriter
+
+from result_cache import result_cache, contract_key
+
+SECTION_INDEX = os.getenv("SECTION_INDEX", "1") == "1"
+# Contracts shorter than this are always sent whole.
+SECTION_INDEX_MIN_PAGES = int(os.getenv("SECTION_INDEX_MIN_PAGES", "8"))
+# A subset is only used when it keeps at most this share of the pages.
+SECTION_INDEX_MAX_SHARE = float(os.getenv("SECTION_INDEX_MAX_SHARE", "0.6"))
+# Pages kept after each matching page, for tables that run over a page break.
+SECTION_INDEX_SPILL = int(os.getenv("SECTION_INDEX_SPILL", "1"))
+
+# The first page with the weekly charges bands goes into every subset, so
+# the band labels the prompts quote can be found next to the tables.
+BAND_HEADING = r"weekly\s+charges?\s+band"
+
+# Headings that mark the pages each extraction module reads.
+SECTIONS = {
+    "domestic_air_accesorials": [
+        r"next\s+day\s+air", r"2nd\s+day\s+a", r"3\s+day\s+select", r"accessorial",
+        r"delivery\s+area\s+surcharge", r"residential", r"additional\s+handling",
+        r"duty\s+and\s+tax\s+forwarding",
+    ],
+    "domestic_ground": [
+        r"portfolio\s+tier\s+incentive", r"addendum\s+1\b", r"commodity\s+tier",
+        r"ground\s+cwt", r"ground\s+(commercial|residential)",
+    ],
+    "international": [
+        r"worldwide\s+(express|saver|expedited)", r"standard\s+to\s+(canada|mexico)",
+        r"international", r"incentives?\s+off\s+effective\s+rates",
+    ],
+}
+
+SECTION_INDEX_VERSION = hashlib.sha256(
+    repr((BAND_HEADING, SECTIONS, SECTION_INDEX_SPILL)).encode()).hexdigest()[:12]
+
+
+def read_pages(reader):
+    """Returns the lower-cased text of each page of a PDF."""
+    return [" ".join((page.extract_text() or "").lower().split()) for page in reader.pages]
+
+
+def build_index(pages):
+    """Maps each module to the pages its subset keeps, or None for the full contract."""
+    if len(pages) < SECTION_INDEX_MIN_PAGES:
+        return {"pages": len(pages), "sections": {}}
+
+    bandPages = [i for i, text in enumerate(pages) if re.search(BAND_HEADING, text)]
+
+    sections = {}
+    for module, headings in SECTIONS.items():
+        pattern = re.compile("|".join(headings))
+        matches = [i for i, text in enumerate(pages) if pattern.search(text)]
+        if not matches:
+            sections[module] = None
+            continue
+
+        kept = set(bandPages[:1])
+        for i in matches:
+            kept.update(range(i, min(i + SECTION_INDEX_SPILL + 1, len(pages))))
+        share = len(kept) / len(pages)
+        sections[module] = sorted(kept) if share <= SECTION_INDEX_MAX_SHARE else None
+
+    return {"pages": len(pages), "sections": sections}
+
+
+def write_subset(reader, pages):
+    """Returns the bytes of a PDF made of the given pages."""
+    writer = PdfWriter()
+    for i in pages:
+        writer.add_page(reader.pages[i])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def split_contract(stream, index=None):
+    """Indexes a contract, unless its index is given, and writes each module's subset.
+
+    Returns (index, {module: PDF bytes}). Blocking; run it in a thread.
+    """
+    stream.seek(0)
+    reader = PdfReader(stream)
+    if index is None:
+        index = build_index(read_pages(reader))
+    subsets = {module: write_subset(reader, pages)
+               for module, pages in index["sections"].items() if pages}
+    return index, subsets
+
+
+def index_key(file):
+    return "|".join([contract_key(file), "sections", SECTION_INDEX_VERSION])
+
+
+def load_index(file):
+    """The cached section index of an uploaded contract, or None.
+
+    Read with peek, so the result cache's hit and miss counts stay about
+    extraction results.
+    """
+    return result_cache.peek(index_key(file))
+
+
+def save_index(file, index):
+    result_cache.set(index_key(file), "sections", index)
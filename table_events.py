@@ -0,0 +1,27 @@
+import contextvars
+
+# Set by analysis.stream_tables; called with (table, value) for each table as
+# soon as it has been parsed, before the rest of its module is done.
+table_sink = contextvars.ContextVar("table_sink", default=None)
+
+
+def emit_table(table, value):
+    sink = table_sink.get()
+    if sink:
+        sink(table, value)
+    return value
+
+
+async def emitting(tables, awaitable):
+    """Awaits a table request and reports the table once it is parsed.
+
+    `tables` is the table's response key, or the list of keys of a reply that
+    holds several tables.
+    """
+    value = await awaitable
+    if isinstance(tables, str):
+        emit_table(tables, value)
+    else:
+        for table in tables:
+            emit_table(table, value[table])
+    return value
@@ -0,0 +1,401 @@
+"""Output tables produced by the extraction modules.
+
+Each table is declared once as a template with empty leaves. The template is
+turned into a Gemini response_schema so the model returns exactly this shape
+as JSON, without the template having to be pasted into the prompt.
+"""
+
+
+def schema_from_template(template):
+    if isinstance(template, dict):
+        return {
+            "type": "object",
+            "properties": {key: schema_from_template(value) for key, value in template.items()},
+            "required": list(template),
+        }
+    if isinstance(template, list):
+        return {"type": "array", "items": schema_from_template(template[0])}
+    return {"type": "string", "nullable": True}
+
+
+def with_schema(generation_config, template):
+    return {**generation_config, "response_schema": schema_from_template(template)}
+
+
+DOMESTIC_AIR = {
+    "Domestic Air Service Level": {
+        "Next Day Air": {
+            "Letter": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Next Day Air Saver": {
+            "Letter": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "2nd Day AM": {
+            "Letter": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "2nd Day Air": {
+            "Letter": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "3 Day Select": {
+            "Package": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Next Day Air CWT": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        },
+        "Next Day Air Saver CWT": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        },
+        "2nd Day AM CWT": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        },
+        "2nd Day Air CWT": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        },
+        "3 Day Select CWT": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        }
+    }
+}
+
+ACCESORIALS = [
+    {
+        "ACCESSORIAL_CHARGE": "DAS Comm",
+        "TERM": "Air",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Ext Comm",
+        "TERM": "Air",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Resi",
+        "TERM": "Air",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Ext Resi",
+        "TERM": "Air",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Comm",
+        "TERM": "Ground",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Ext Comm",
+        "TERM": "Ground",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Resi",
+        "TERM": "Ground",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "DAS Ext Resi",
+        "TERM": "Ground",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "Residential Fee",
+        "TERM": "Air",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "Residential Fee",
+        "TERM": "Ground",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "Additional Handling - ALL",
+        "TERM": "Domestic",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "Additional Handling - ALL",
+        "TERM": "Export",
+        "CURRENT_UPS": ""
+    },
+    {
+        "ACCESSORIAL_CHARGE": "Duty and Tax Forwarding",
+        "TERM": "Export",
+        "CURRENT_UPS": ""
+    }
+]
+
+DOMESTIC_GROUND_1 = {
+    "DOMESTIC GROUND SERVICE LEVEL": {
+        "UPS® Ground - Commercial Package - Prepaid": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        },
+        "UPS® Ground - Residential Package - Prepaid": {
+            "Weight Range": "All",
+            "Current UPS": ""
+        }
+    }
+}
+
+DOMESTIC_GROUND_2 = {
+    "DOMESTIC GROUND SERVICE LEVEL": {
+        "UPS® Ground - Commercial Package - Prepaid - Incentives Off Effective Rates": {
+            "1-5 lbs": "",
+            "6-10 lbs": "",
+            "11-20 lbs": "",
+            "21-30 lbs": "",
+            "31-50 lbs": "",
+            "51-70 lbs": "",
+            "71-150 lbs": "",
+            "151 lbs+": ""
+        },
+        "UPS® Ground - Residential Package - Prepaid - Incentives Off Effective Rates": {
+            "1-5 lbs": "",
+            "6-10 lbs": "",
+            "11-20 lbs": "",
+            "21-30 lbs": "",
+            "31-50 lbs": "",
+            "51-70 lbs": "",
+            "71-150 lbs": "",
+            "151 lbs+": ""
+        }
+    }
+}
+
+DOMESTIC_GROUND_3 = {
+    "DOMESTIC GROUND SERVICE LEVEL": {
+        "Ground CWT": {
+            "Weight Range": "All",
+            "Current UPS": "",
+            "Discount": "",
+            "Tier": ""
+        }
+    }
+}
+
+INTERNATIONAL_1 = {
+    "INTERNATIONAL SERVICE LEVEL": {
+        "Export": {
+            "UPS Worldwide Express®": {
+                "Letter": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Document": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Pak": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Package": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                }
+            },
+            "UPS Worldwide Saver®": {
+                "Letter": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Document": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Pak": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Package": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                }
+            },
+            "UPS Worldwide Expedited®": {
+                "Document": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Package": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                }
+            },
+            "UPS® Standard to Canada": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "UPS® Standard to Mexico": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Import": {
+            "UPS Worldwide Express®": {
+                "Letter": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Document": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Package": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                }
+            },
+            "UPS Worldwide Saver®": {
+                "Letter": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Document": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                },
+                "Package": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                }
+            },
+            "UPS Worldwide Expedited®": {
+                "Package": {
+                    "Weight Range": "All",
+                    "Current UPS": ""
+                }
+            },
+            "UPS® Standard from Canada": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "UPS® Standard from Mexico": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        }
+    }
+}
+
+INTERNATIONAL_2 = {
+    "International Service Level": {
+        "Export UPS Worldwide Express®": {
+            "Letter - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Document - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Pak - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Export UPS Worldwide Saver®": {
+            "Letter - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Document - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Pak - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Export UPS Worldwide Expedited®": {
+            "Document - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Import UPS Worldwide Express®": {
+            "Letter - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Document - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Import UPS Worldwide Saver®": {
+            "Letter - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Document - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            },
+            "Package - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        },
+        "Import UPS Worldwide Expedited®": {
+            "Package - Incentives Off Effective Rates": {
+                "Weight Range": "All",
+                "Current UPS": ""
+            }
+        }
+    }
+}
@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+import main
+
+PDF = ("contract.pdf", b"%PDF-1.4\n%%EOF\n", "application/pdf")
+
+
+def test_rejected_callback_url_copies_nothing(monkeypatch):
+    copies = []
+
+    async def copy_upload(file):
+        copies.append(file)
+    monkeypatch.setattr(main, "copy_upload", copy_upload)
+
+    response = TestClient(main.app).post(
+        "/api/analyze/jobs", files={"file": PDF},
+        data={"weeklyChargesBand": "0.01 - 19,429.99", "callbackUrl": "http://attacker.test/hook"})
+
+    assert response.status_code == 400
+    assert "callbackUrl" in response.json()["detail"]
+    assert not copies
+
+
+def test_failed_submit_closes_the_copy(monkeypatch):
+    copies = []
+    real_copy_upload = main.copy_upload
+
+    async def copy_upload(file):
+        copies.append(await real_copy_upload(file))
+        return copies[-1]
+
+    async def submit(upload, weeklyChargesBand, callbackUrl=None):
+        raise ValueError("queue is full")
+    monkeypatch.setattr(main, "copy_upload", copy_upload)
+    monkeypatch.setattr(main.analysis_jobs, "submit", submit)
+
+    response = TestClient(main.app).post(
+        "/api/analyze/jobs", files={"file": PDF}, data={"weeklyChargesBand": "0.01 - 19,429.99"})
+
+    assert response.status_code == 400
+    copy, = copies
+    assert copy.file.closed
@@ -0,0 +1,72 @@
+import asyncio
+import types
+import uuid
+
+import pytest
+
+import band_table
+from band_table import BandTable, BandTables
+
+
+def test_resolve():
+    table = BandTable(["19,430.00 - 37,779.99", "0.01 - 19,429.99", "37,780.00+"])
+    assert table.resolve("16,856") == "0.01 - 19,429.99"
+    assert table.resolve("$20,000.00") == "19,430.00 - 37,779.99"
+    assert table.resolve("1,000,000") == "37,780.00+"
+    assert table.resolve("0") == "0.01 - 19,429.99"
+
+
+def contract():
+    return types.SimpleNamespace(name=f"files/{uuid.uuid4().hex}")
+
+
+def extractor(labels):
+    calls = []
+
+    async def extract(file):
+        calls.append(file)
+        return labels
+
+    return extract, calls
+
+
+def test_extracts_once(monkeypatch):
+    extract, calls = extractor(["0.01 - 19,429.99", "19,430.00+"])
+    monkeypatch.setattr(band_table, "extract_band_labels", extract)
+    tables, file = BandTables(), contract()
+
+    async def run():
+        return [await tables.resolve(file, amount) for amount in ("100", "20,000")]
+
+    assert asyncio.run(run()) == ["0.01 - 19,429.99", "19,430.00+"]
+    assert len(calls) == 1
+
+
+def test_unreadable_table_is_not_extracted_again(monkeypatch):
+    extract, calls = extractor(["see addendum"])
+    monkeypatch.setattr(band_table, "extract_band_labels", extract)
+    tables, file = BandTables(), contract()
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                await tables.resolve(file, "100")
+
+    asyncio.run(run())
+    assert len(calls) == 1
+    assert tables.stats()["failures"] == 1
+    assert tables.stats()["failure_hits"] == 2
+
+
+def test_failure_expires(monkeypatch):
+    extract, calls = extractor([])
+    monkeypatch.setattr(band_table, "extract_band_labels", extract)
+    tables, file = BandTables(failureTtl=0), contract()
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await tables.get(file)
+
+    asyncio.run(run())
+    assert len(calls) == 2
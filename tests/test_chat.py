@@ -0,0 +1,79 @@
+import asyncio
+import time
+import types
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import chat
+from chat_sessions import ChatSessionStore
+from fake_gemini import FakeClient, FakeFile
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeClient(0, contextCaching=True)
+    monkeypatch.setattr(chat, "get_client", lambda: fake)
+    monkeypatch.setattr(chat, "chat_sessions", ChatSessionStore())
+    return fake
+
+
+HISTORY = [
+    types.SimpleNamespace(role="user", content="What is the Ground discount?"),
+    types.SimpleNamespace(role="model", content="45%."),
+]
+
+
+def turn(file, session_id, history=()):
+    return asyncio.run(chat.open_session(file, list(history), session_id))
+
+
+def test_live_session_is_reused(fake):
+    file = FakeFile()
+    session_id, entry = turn(file, None)
+    assert turn(file, session_id, HISTORY) == (session_id, entry)
+
+
+@pytest.mark.parametrize("lose", [
+    lambda cache: cache.entries.clear(),
+    lambda cache: [setattr(entry, "expiresAt", time.monotonic() - 1)
+                   for entry in cache.entries.values()],
+], ids=["evicted", "expired"])
+def test_session_is_rebuilt_when_its_cached_context_is_gone(fake, lose):
+    file = FakeFile()
+    session_id, entry = turn(file, None)
+    assert entry.chat_session.model.cached_content is not None
+    lose(fake.context_cache)
+
+    newId, rebuilt = turn(file, session_id, HISTORY)
+
+    assert newId != session_id
+    assert chat.chat_sessions.get(session_id, file.name) is None
+    assert [h["parts"][0] for h in rebuilt.chat_session.history] == [h.content for h in HISTORY]
+    assert fake.context_cache.stats()["lost"] == 1
+
+
+def test_turns_refresh_a_context_about_to_expire(fake):
+    file = FakeFile()
+    session_id, entry = turn(file, None)
+    cached, = fake.context_cache.entries.values()
+    cached.expiresAt = time.monotonic() + 10
+
+    assert turn(file, session_id) == (session_id, entry)
+    assert fake.context_cache.refreshes == 1
+    assert cached.expiresAt > time.monotonic() + 10
+
+
+def test_session_is_dropped_when_the_api_lost_its_context(fake, monkeypatch):
+    file = FakeFile()
+    session_id, entry = turn(file, None)
+
+    async def gone(*args, **kwargs):
+        raise api_exceptions.NotFound("cachedContents/abc not found")
+    monkeypatch.setattr(entry.chat_session, "send_message_async", gone)
+
+    with pytest.raises(api_exceptions.NotFound):
+        asyncio.run(chat.handle_chat(file, "And Ground CWT?", HISTORY, session_id))
+
+    assert chat.chat_sessions.get(session_id, file.name) is None
+    assert not fake.context_cache.entries
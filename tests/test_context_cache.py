@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import context_cache
+import resilience
+from context_cache import EXTRACTION_TURNS
+from fake_gemini import FakeClient, FakeFile
+from gemini_client import FLASH_MODEL
+from resilience import CircuitBreakers
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "breakers", CircuitBreakers())
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_TIMEOUT", 0.05)
+
+
+class FlakyCacheClient(FakeClient):
+    """FakeClient whose cache creates fail, or hang, until told otherwise."""
+
+    def __init__(self, fault):
+        super().__init__(0, contextCaching=True)
+        self.fault = fault
+        self.creates = 0
+
+    async def create_cached_content(self, modelName, contents, ttl):
+        self.creates += 1
+        if self.fault == "hang":
+            await asyncio.Event().wait()
+        if self.fault is not None:
+            raise self.fault("cache create failed")
+        return await super().create_cached_content(modelName, contents, ttl)
+
+
+def start_tables(client, file, tables=5):
+    async def run():
+        return await asyncio.gather(*(
+            client.start_contract_chat(FLASH_MODEL, file, EXTRACTION_TURNS)
+            for _ in range(tables)))
+    return asyncio.run(run())
+
+
+def is_inline(chat_session):
+    return chat_session.model.cached_content is None and len(chat_session.history) == 2
+
+
+@pytest.mark.parametrize("fault", ["hang", api_exceptions.ServiceUnavailable])
+def test_failed_create_falls_back_inline_without_blacklisting(fault):
+    client = FlakyCacheClient(fault)
+    file = FakeFile()
+
+    sessions = start_tables(client, file)
+
+    assert all(is_inline(session) for session in sessions)
+    assert client.creates == resilience.RETRY_MAX_ATTEMPTS
+    assert not client.context_cache.uncacheable
+
+    client.fault = None
+    sessions = start_tables(client, file)
+    assert all(session.model.cached_content is not None for session in sessions)
+
+
+def test_refused_create_is_remembered():
+    client = FlakyCacheClient(api_exceptions.InvalidArgument)
+    file = FakeFile()
+
+    start_tables(client, file)
+    start_tables(client, file)
+
+    assert client.creates == 1
+    assert len(client.context_cache.uncacheable) == 1
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from discounts_international import merge_international, INCENTIVES_OFF
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def international1():
+    return load("international1.json")
+
+
+@pytest.fixture
+def international2():
+    return load("international2.json")
+
+
+def test_joins_incentives_off_by_direction_service_and_package(international1, international2):
+    merged = merge_international(international1, international2)["INTERNATIONAL SERVICE LEVEL"]
+
+    offRates = international2["International Service Level"]
+    for direction, services in international1["INTERNATIONAL SERVICE LEVEL"].items():
+        for service, packages in services.items():
+            if "Current UPS" in packages:
+                continue
+            for packageType, row in packages.items():
+                off = offRates[f"{direction} {service}"][f"{packageType} - {INCENTIVES_OFF}"]
+                assert merged[direction][service][packageType] == {
+                    **row, INCENTIVES_OFF: off["Current UPS"]}
+
+
+def test_example_row(international1, international2):
+    merged = merge_international(international1, international2)["INTERNATIONAL SERVICE LEVEL"]
+    assert merged["Import"]["UPS Worldwide Saver®"]["Document"] == {
+        "Weight Range": "All",
+        "Current UPS": international1["INTERNATIONAL SERVICE LEVEL"]["Import"]
+        ["UPS Worldwide Saver®"]["Document"]["Current UPS"],
+        INCENTIVES_OFF: international2["International Service Level"]
+        ["Import UPS Worldwide Saver®"]["Document - Incentives Off Effective Rates"]["Current UPS"],
+    }
+
+
+@pytest.mark.parametrize("direction, service", [
+    ("Export", "UPS® Standard to Canada"),
+    ("Export", "UPS® Standard to Mexico"),
+    ("Import", "UPS® Standard from Canada"),
+    ("Import", "UPS® Standard from Mexico"),
+])
+def test_standard_rows_are_copied_unchanged(international1, international2, direction, service):
+    merged = merge_international(international1, international2)["INTERNATIONAL SERVICE LEVEL"]
+    assert merged[direction][service] == international1["INTERNATIONAL SERVICE LEVEL"][direction][service]
+    assert INCENTIVES_OFF not in merged[direction][service]
+
+
+def test_missing_incentives_off_rows_are_empty(international1, international2):
+    offRates = international2["International Service Level"]
+    del offRates["Export UPS Worldwide Expedited®"]
+    del offRates["Import UPS Worldwide Express®"]["Letter - Incentives Off Effective Rates"]
+    offRates["Import UPS Worldwide Saver®"]["Package - Incentives Off Effective Rates"] = None
+
+    merged = merge_international(international1, international2)["INTERNATIONAL SERVICE LEVEL"]
+
+    assert merged["Export"]["UPS Worldwide Expedited®"]["Document"][INCENTIVES_OFF] == ""
+    assert merged["Export"]["UPS Worldwide Expedited®"]["Package"][INCENTIVES_OFF] == ""
+    assert merged["Import"]["UPS Worldwide Express®"]["Letter"][INCENTIVES_OFF] == ""
+    assert merged["Import"]["UPS Worldwide Saver®"]["Package"][INCENTIVES_OFF] == ""
+    assert merged["Import"]["UPS Worldwide Express®"]["Document"][INCENTIVES_OFF] != ""
+
+
+def test_empty_replies():
+    assert merge_international({}, {}) == {"INTERNATIONAL SERVICE LEVEL": {}}
+
+
+def test_inputs_are_not_modified(international1, international2):
+    before = json.dumps([international1, international2], sort_keys=True)
+    merge_international(international1, international2)
+    assert json.dumps([international1, international2], sort_keys=True) == before
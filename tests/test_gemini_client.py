@@ -0,0 +1,82 @@
+import asyncio
+import types
+
+from google.api_core import grpc_helpers_async
+from google.generativeai import protos
+from google.generativeai.types.generation_types import AsyncGenerateContentResponse
+
+from fake_gemini import FakeClient
+from gemini_client import FLASH_MODEL
+
+
+def chunk(text):
+    return protos.GenerateContentResponse(
+        candidates=[{"content": {"role": "model", "parts": [{"text": text}]}}])
+
+
+class GrpcStreamCall:
+    """Stands in for grpc.aio's UnaryStreamCall: yields chunks, then keeps generating."""
+
+    def __init__(self, texts, endless):
+        self.texts = texts
+        self.endless = endless
+        self.cancelled = False
+
+    async def chunks(self):
+        for text in self.texts:
+            await asyncio.sleep(0)
+            yield chunk(text)
+        if self.endless:
+            await asyncio.Event().wait()
+
+    def __aiter__(self):
+        return self.chunks()
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+
+class StreamingChat:
+    """A chat session whose streamed replies are built the way the SDK builds them."""
+
+    def __init__(self, texts, endless=False):
+        self.model = types.SimpleNamespace(model_name=f"models/{FLASH_MODEL}")
+        self.history = []
+        self.call = GrpcStreamCall(texts, endless)
+        self.wrapped = grpc_helpers_async._WrappedUnaryStreamCall().with_call(self.call)
+        self.rewound = False
+
+    async def send_message_async(self, content, stream=False, **kwargs):
+        return await AsyncGenerateContentResponse.from_aiterator(self.wrapped)
+
+    def rewind(self):
+        self.rewound = True
+
+
+def test_abandoned_stream_cancels_the_call():
+    client = FakeClient(0)
+    chat = StreamingChat(["The ", "discount ", "is "], endless=True)
+
+    async def run():
+        stream = client.stream_message(chat, "hi")
+        first = await anext(stream)
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) == "The "
+    assert chat.call.cancelled
+    assert chat.rewound
+    assert chat.wrapped._wrapped_async_generator.ag_frame is None
+
+
+def test_finished_stream_is_not_cancelled():
+    client = FakeClient(0)
+    chat = StreamingChat(["The ", "discount ", "is 61%."])
+
+    async def run():
+        return [text async for text in client.stream_message(chat, "hi")]
+
+    assert asyncio.run(run()) == ["The ", "discount ", "is 61%."]
+    assert not chat.call.cancelled
+    assert not chat.rewound
@@ -0,0 +1,111 @@
+import copy
+
+from band_sweep import sweep_template
+from model_router import (
+    ModelRouter, has_values, filled_share, answered_share, ROUTER_MIN_SAMPLES, ROUTER_PROBE_EVERY)
+from band_table import BAND_TABLE
+from table_schemas import DOMESTIC_AIR, ACCESORIALS
+
+FLASH, PRO = "flash", "pro"
+
+
+def fill(template, value="50.00%"):
+    if isinstance(template, dict):
+        return {key: fill(child, value) for key, child in template.items()}
+    if isinstance(template, list):
+        return [fill(item, value) for item in template]
+    return value if template == "" else template
+
+
+def test_empty_template_has_no_values():
+    assert filled_share(DOMESTIC_AIR, DOMESTIC_AIR) == 0.0
+    assert not has_values(DOMESTIC_AIR, DOMESTIC_AIR)
+
+
+def test_prefilled_labels_do_not_count():
+    rows = copy.deepcopy(ACCESORIALS)
+    assert answered_share(rows, ACCESORIALS) == 0.0
+    assert not has_values(rows, ACCESORIALS, "accesorials")
+
+
+def test_null_answers_are_valid():
+    rows = copy.deepcopy(ACCESORIALS)
+    for row in rows:
+        row["CURRENT_UPS"] = None
+    assert filled_share(rows, ACCESORIALS) == 0.0
+    assert answered_share(rows, ACCESORIALS) == 1.0
+    assert has_values(rows, ACCESORIALS, "accesorials")
+
+
+def test_tables_that_need_values():
+    assert not has_values({"weeklyChargesBands": [None]}, BAND_TABLE, "band_table")
+    assert has_values({"weeklyChargesBands": ["0.01 - 19,429.99"]}, BAND_TABLE, "band_table")
+
+
+def test_filled_table_has_values():
+    assert filled_share(fill(DOMESTIC_AIR), DOMESTIC_AIR) == 1.0
+    assert has_values(fill(DOMESTIC_AIR), DOMESTIC_AIR)
+
+
+def test_too_few_filled_cells():
+    rows = fill(ACCESORIALS)
+    for row in rows[len(rows) // 4:]:
+        row["CURRENT_UPS"] = ""
+    assert filled_share(rows, ACCESORIALS) == len(rows) // 4 / len(rows)
+    assert not has_values(rows, ACCESORIALS)
+
+
+def test_list_cells():
+    template = {"weeklyChargesBands": [""]}
+    assert not has_values({"weeklyChargesBands": []}, template)
+    assert not has_values({"weeklyChargesBands": ["", ""]}, template)
+    assert not has_values({"weeklyChargesBands": ["", "", None]}, template)
+    assert has_values({"weeklyChargesBands": ["0.01 - 19,429.99"]}, template)
+
+
+def test_sweep_cells():
+    swept = sweep_template(DOMESTIC_AIR)
+    assert not has_values(swept, swept)
+    assert has_values(fill(swept), swept)
+
+
+def record(router, table, model, ok, latency, count=ROUTER_MIN_SAMPLES):
+    for _ in range(count):
+        router.record(table, model, ok, latency)
+
+
+def test_start_cheapest_without_samples():
+    router = ModelRouter([FLASH, PRO])
+    record(router, "t", FLASH, False, 1.0, ROUTER_MIN_SAMPLES - 1)
+    assert router.start("t") == 0
+
+
+def test_start_skips_unreliable_model():
+    router = ModelRouter([FLASH, PRO])
+    record(router, "t", FLASH, False, 1.0)
+    assert router.start("t") == 1
+    assert router.start("other") == 0
+
+
+def test_start_keeps_reliable_model():
+    router = ModelRouter([FLASH, PRO])
+    record(router, "t", FLASH, True, 1.0)
+    record(router, "t", PRO, True, 3.0)
+    assert router.start("t") == 0
+
+
+def test_start_skips_model_slower_than_escalating():
+    router = ModelRouter([FLASH, PRO])
+    # Successful often enough, but its latency beats nothing.
+    for i in range(ROUTER_MIN_SAMPLES):
+        router.record("t", FLASH, i % 5 != 0, 3.0)
+    record(router, "t", PRO, True, 2.0)
+    assert router.start("t") == 1
+
+
+def test_models_for_probes_skipped_model():
+    router = ModelRouter([FLASH, PRO])
+    record(router, "t", FLASH, False, 1.0)
+    routes = [router.models_for("t") for _ in range(ROUTER_PROBE_EVERY)]
+    assert routes[:-1] == [[PRO]] * (ROUTER_PROBE_EVERY - 1)
+    assert routes[-1] == [FLASH, PRO]
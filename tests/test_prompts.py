@@ -0,0 +1,37 @@
+import pytest
+
+from prompts import prompts, PromptRegistry, PromptBudgetError
+
+
+def test_every_prompt_is_within_its_budget():
+    prompts.check()
+
+
+def test_check_fails_when_a_prompt_outgrows_its_budget():
+    registry = PromptRegistry()
+    registry.register("long", "Fill the table for $band. " * 20, budget=10, sample={"band": "1 - 2"})
+    with pytest.raises(PromptBudgetError):
+        registry.check()
+
+
+def test_long_request_parameter_is_counted_not_refused():
+    registry = PromptRegistry()
+    template = registry.register("band", "The weekly charges band is $band.", budget=20)
+    prompt = registry.render("band", band="9" * 1000)
+    assert prompt.endswith("9.")
+    assert template.stats()["over_budget"] == 1
+    assert template.stats()["max_tokens"] > 20
+
+
+def test_parameters_must_match():
+    with pytest.raises(TypeError):
+        prompts.render("domestic_air")
+    with pytest.raises(TypeError):
+        prompts.render("international_2", weeklyChargesBand="1 - 2")
+
+
+def test_bound_parameters_keep_dollar_escapes():
+    registry = PromptRegistry()
+    registry.register("fixed", "Bands ($$) for $what in $year.", budget=50, what="a $5 fee")
+    assert registry.render("fixed", year="2024") == "Bands ($) for a $5 fee in 2024."
+    assert "$" in prompts.render("portfolio_tier", weeklyChargesBand="0.01 - 19,429.99")
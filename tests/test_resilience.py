@@ -0,0 +1,244 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import gemini_client
+import resilience
+import response_parser
+from fake_gemini import FakeClient, FaultyClient, FakeFile
+from gemini_client import generation_config, set_client, FLASH_MODEL, PRO_MODEL
+from model_router import ModelRouter
+from model_scheduler import ModelCallScheduler
+from resilience import (
+    CircuitBreaker, CircuitBreakers, CircuitOpenError, DeadlineExceededError,
+    call_with_retries, start_deadline)
+from table_schemas import DOMESTIC_AIR, with_schema
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    breakers = CircuitBreakers()
+    for module in (resilience, gemini_client, response_parser):
+        monkeypatch.setattr(module, "breakers", breakers)
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.0)
+    return breakers
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.minCalls):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == "open"
+
+
+def admit(breaker):
+    """allow(), and whether the call it admitted is the trial."""
+    return breaker.allow() and breaker.state == "half_open"
+
+
+def test_opens_at_error_rate(clock):
+    breaker = CircuitBreaker("m", minCalls=4, errorRate=0.5)
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert breaker.state == "closed"
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert not breaker.available()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_one_trial_after_cooldown(clock):
+    breaker = CircuitBreaker("m", minCalls=2, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+
+    assert breaker.available()
+    assert admit(breaker)
+    # A burst behind the trial fails fast instead of reaching the model.
+    assert [breaker.allow() for _ in range(5)] == [False] * 5
+    assert not breaker.available()
+
+    breaker.record(True, trial=True)
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker("m", minCalls=2, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert admit(breaker)
+    breaker.record(False, trial=True)
+    assert breaker.state == "open"
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_late_calls_do_not_settle_trial(clock):
+    breaker = CircuitBreaker("m", minCalls=2, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert admit(breaker)
+    breaker.record(True)
+    breaker.abandon(False)
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+
+def test_abandoned_trial_frees_slot(clock):
+    breaker = CircuitBreaker("m", minCalls=2, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert admit(breaker)
+    breaker.abandon(True)
+    assert admit(breaker)
+    assert not breaker.allow()
+
+
+def test_stuck_trial_is_replaced_after_cooldown(clock):
+    breaker = CircuitBreaker("m", minCalls=2, cooldown=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert admit(breaker)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert admit(breaker)
+
+
+def test_available_filters_in_order(clock):
+    breakers = CircuitBreakers()
+    open_breaker(breakers.get("a"))
+    assert breakers.available(["a", "b", "c"]) == ["b", "c"]
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return attempt, calls
+
+
+def test_retries_transient_errors(breakers):
+    attempt, calls = failing([api_exceptions.TooManyRequests("429"),
+                              api_exceptions.ServiceUnavailable("503")])
+    assert asyncio.run(call_with_retries("m", attempt)) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_max_attempts(breakers):
+    attempt, calls = failing([api_exceptions.ServiceUnavailable("503")] * 10)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        asyncio.run(call_with_retries("m", attempt))
+    assert len(calls) == resilience.RETRY_MAX_ATTEMPTS
+
+
+def test_does_not_retry_other_errors(breakers):
+    attempt, calls = failing([api_exceptions.InvalidArgument("400")])
+    with pytest.raises(api_exceptions.InvalidArgument):
+        asyncio.run(call_with_retries("m", attempt))
+    assert len(calls) == 1
+    assert breakers.get("m").stats()["recent_calls"] == 0
+
+
+def test_timeout_capped_by_deadline(breakers):
+    attempt, calls = failing([])
+
+    async def run():
+        start_deadline(5)
+        return await call_with_retries("m", attempt, timeout=120)
+
+    asyncio.run(run())
+    assert 0 < calls[0] <= 5
+
+
+def test_no_call_after_deadline(breakers):
+    attempt, calls = failing([])
+
+    async def run():
+        start_deadline(0)
+        return await call_with_retries("m", attempt)
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+    assert calls == []
+
+
+def test_open_breaker_fails_fast(breakers):
+    open_breaker(breakers.get("m"))
+    attempt, calls = failing([])
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_with_retries("m", attempt))
+    assert calls == []
+
+
+def test_outage_routes_tables_to_other_model(breakers, monkeypatch):
+    fake = FaultyClient(0.0, down={FLASH_MODEL})
+    set_client(fake)
+    monkeypatch.setattr(response_parser, "router", ModelRouter([FLASH_MODEL, PRO_MODEL]))
+    config = with_schema(generation_config, DOMESTIC_AIR)
+
+    async def run():
+        for _ in range(5):
+            await response_parser.request_table(
+                FLASH_MODEL, FakeFile(), "prompt", DOMESTIC_AIR, config, table="domestic_air")
+
+    asyncio.run(run())
+    assert breakers.get(FLASH_MODEL).state == "open"
+    assert breakers.get(PRO_MODEL).state == "closed"
+    # Once the flash breaker is open, tables go straight to the other model.
+    assert fake.faults[503] == breakers.get(FLASH_MODEL).minCalls
+
+
+def test_scheduler_queue_does_not_count_against_timeout(breakers, monkeypatch):
+    # Two slots, 0.2s calls and a 0.5s timeout: most calls queue for longer
+    # than the timeout, but none of them is slow.
+    monkeypatch.setattr(gemini_client, "scheduler", ModelCallScheduler(maxInFlight=2))
+    fake = FakeClient(0.2)
+    fake.timeout = 0.5
+
+    async def run():
+        chats = [fake.start_chat(FLASH_MODEL) for _ in range(8)]
+        return await asyncio.gather(*(fake.send_message(chat, "hi") for chat in chats))
+
+    assert len(asyncio.run(run())) == 8
+    assert breakers.get(FLASH_MODEL).stats()["recent_failures"] == 0
+    assert fake.calls == 8
+
+
+def test_deadline_while_queued_is_not_a_model_failure(breakers, monkeypatch):
+    scheduler = ModelCallScheduler(maxInFlight=1)
+    monkeypatch.setattr(gemini_client, "scheduler", scheduler)
+    fake = FakeClient(0.5)
+
+    async def run():
+        async with scheduler.slot(0):
+            start_deadline(0.1)
+            await fake.send_message(fake.start_chat(FLASH_MODEL), "hi")
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run())
+    assert breakers.get(FLASH_MODEL).stats()["recent_calls"] == 0
+    assert fake.calls == 0
@@ -0,0 +1,57 @@
+import re
+
+import pytest
+
+from response_parser import TableParseError, json_candidates, parse_table
+
+TEMPLATE = {"Ground": {"Weight Range": "All", "Current UPS": ""}}
+TABLE = {"Ground": {"Weight Range": "All", "Current UPS": "45.00%"}}
+REPLY = '{"Ground": {"Weight Range": "All", "Current UPS": "45.00%"}}'
+
+
+@pytest.mark.parametrize("text", [
+    REPLY,
+    f"```json\n{REPLY}\n```",
+    f"Here is the table:\n{REPLY}\nLet me know if you need anything else.",
+    f"Note {{see below}}: {REPLY}",
+    f"Rates as of [2024] follow. {REPLY} [1] Incentives apply.",
+    '{"Ground": {"Weight Range": "All", "Current UPS": "45.00%",},}',
+    "{“Ground”: {“Weight Range”: “All”, “Current UPS”: “45.00%”}}",
+], ids=["bare", "fenced", "prose", "prose-braces", "prose-brackets",
+        "trailing-commas", "smart-quotes"])
+def test_parses_the_table_out_of_the_reply(text):
+    assert parse_table(text, TEMPLATE) == TABLE
+
+
+def test_repairs_python_literals_outside_strings():
+    text = '{"Ground": {"Weight Range": "None", "Current UPS": None}}'
+    assert parse_table(text, TEMPLATE) == {
+        "Ground": {"Weight Range": "None", "Current UPS": None}}
+
+
+@pytest.mark.parametrize("text", [
+    '{"Ground": {"Weight Range": "All", "Current UPS": "45.00%"',
+    '{"Ground": {"Weight Range": "All", "Current UPS": "45.00%',
+    '{"Ground": {"Weight Range": "All", "Current UPS": "45.00%",',
+])
+def test_closes_truncated_replies(text):
+    assert parse_table(text, TEMPLATE) == TABLE
+
+
+def test_brackets_inside_a_candidate_do_not_start_another():
+    text = 'a {"x": [1, {"y": "}"}]} b [2]'
+    assert list(json_candidates(text)) == ['{"x": [1, {"y": "}"}]}', "[2]"]
+
+
+@pytest.mark.parametrize("text, error", [
+    ("I could not find the table.", "no JSON object"),
+    ("Note {see below}.", "invalid JSON"),
+    ('{"Ground": {"Weight Range": "All"}}', 'missing "Current UPS"'),
+    ('{"Ground": ["All", "45.00%"]}', "$.Ground should be an object"),
+    ('{"Ground": {"Weight Range": "All", "Current UPS": {"rate": 45}}}',
+     "$.Ground.Current UPS should be a single value"),
+    ('Note {see below}: {"Ground": "45.00%"}', "$.Ground should be an object"),
+])
+def test_reports_why_the_reply_is_unusable(text, error):
+    with pytest.raises(TableParseError, match=re.escape(error)):
+        parse_table(text, TEMPLATE)
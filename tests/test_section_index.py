@@ -0,0 +1,101 @@
+import asyncio
+import io
+import types
+import uuid
+
+from google.api_core import exceptions as api_exceptions
+
+import analysis_batch
+import file_upload
+from fake_gemini import sample_contract
+from result_cache import result_cache
+from upload_cache import upload_cache
+from section_index import load_index, save_index
+
+
+def test_index_reads_do_not_count_as_result_cache_hits():
+    file = types.SimpleNamespace(name=f"files/{uuid.uuid4().hex}")
+    before = result_cache.stats()
+    assert load_index(file) is None
+    save_index(file, {"pages": 0, "sections": {}, "digests": {}})
+    assert load_index(file) == {"pages": 0, "sections": {}, "digests": {}}
+    after = result_cache.stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
+
+
+def test_batch_uploads_are_indexed(monkeypatch):
+    indexed = []
+
+    async def upload_contract(upload):
+        return types.SimpleNamespace(name=f"files/{upload.filename}")
+
+    async def index_sections(upload, uploadedFile):
+        indexed.append((upload.filename, uploadedFile.name))
+
+    async def wait_for_files_active(fileNames):
+        return {}
+
+    monkeypatch.setattr(analysis_batch, "upload_contract", upload_contract)
+    monkeypatch.setattr(analysis_batch, "index_sections", index_sections)
+    monkeypatch.setattr(analysis_batch, "wait_for_files_active", wait_for_files_active)
+
+    uploads = [types.SimpleNamespace(filename=name) for name in ("a.pdf", "b.pdf")]
+    asyncio.run(analysis_batch.analyze_batch(uploads, [], ["100", "200"]))
+    assert sorted(indexed) == [("a.pdf", "files/a.pdf"), ("b.pdf", "files/b.pdf")]
+
+
+class SubsetClient:
+    """Uploads subsets, failing those of the modules in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.uploads = []
+
+    async def upload_file(self, file, mime_type, display_name=None):
+        module = display_name.split("(")[-1].rstrip(")")
+        self.uploads.append(module)
+        if module in self.failing:
+            raise api_exceptions.ServiceUnavailable("subset upload failed")
+        return types.SimpleNamespace(name=f"files/{uuid.uuid4().hex}")
+
+    async def get_file(self, name):
+        return types.SimpleNamespace(name=name, state=types.SimpleNamespace(name="ACTIVE"))
+
+
+def upload(tag):
+    return types.SimpleNamespace(filename="contract.pdf", file=io.BytesIO(sample_contract(tag)))
+
+
+def test_failed_subset_upload_falls_back_to_contract(monkeypatch):
+    client = SubsetClient(failing={"international"})
+    monkeypatch.setattr(file_upload, "get_client", lambda: client)
+    contract = types.SimpleNamespace(name=f"files/{uuid.uuid4().hex}")
+    file = upload(uuid.uuid4().hex)
+
+    asyncio.run(file_upload.index_sections(file, contract))
+    index = load_index(contract)
+    assert index["sections"]["international"]
+    assert set(index["digests"]) == {"domestic_air_accesorials", "domestic_ground"}
+
+    assert asyncio.run(file_upload.section_file(contract, "international")) is contract
+    assert asyncio.run(file_upload.section_file(contract, "domestic_ground")) is not contract
+
+    # The next upload of the contract retries only the missing subset.
+    client.failing.clear()
+    client.uploads.clear()
+    asyncio.run(file_upload.index_sections(file, contract))
+    assert client.uploads == ["international"]
+    assert set(load_index(contract)["digests"]) == set(index["sections"])
+
+
+def test_section_file_does_not_count_upload_cache_lookups(monkeypatch):
+    client = SubsetClient()
+    monkeypatch.setattr(file_upload, "get_client", lambda: client)
+    contract = types.SimpleNamespace(name=f"files/{uuid.uuid4().hex}")
+    asyncio.run(file_upload.index_sections(upload(uuid.uuid4().hex), contract))
+
+    before = upload_cache.stats()
+    for module in ("domestic_ground", "international"):
+        asyncio.run(file_upload.section_file(contract, module))
+    after = upload_cache.stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
@@ -0,0 +1,102 @@
+import asyncio
+import datetime
+import types
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import file_upload
+import response_parser
+from upload_cache import ActiveFiles, FILE_EXPIRY_MARGIN
+
+
+def remote_file(name, expiresIn=None):
+    expiration = None
+    if expiresIn is not None:
+        expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expiresIn)
+    return types.SimpleNamespace(
+        name=name, state=types.SimpleNamespace(name="ACTIVE"), expiration_time=expiration)
+
+
+def test_keeps_file_until_near_its_expiry():
+    files = ActiveFiles()
+    files.remember("files/a", remote_file("files/a", 24 * 60 * 60))
+    assert files.get("files/a").name == "files/a"
+
+
+def test_does_not_keep_file_about_to_expire():
+    files = ActiveFiles()
+    # First seen within FILE_EXPIRY_MARGIN of its expiry: not worth keeping.
+    files.remember("files/a", remote_file("files/a", FILE_EXPIRY_MARGIN - 1))
+    assert files.get("files/a") is None
+
+
+def test_drops_entry_once_expiry_is_near():
+    files = ActiveFiles()
+    file = remote_file("files/a", 24 * 60 * 60)
+    files.remember("files/a", file)
+    file.expiration_time -= datetime.timedelta(hours=24)
+    assert files.get("files/a") is None
+    assert files.stats()["entries"] == 0
+
+
+def test_forget():
+    files = ActiveFiles()
+    files.remember("files/a", remote_file("files/a"))
+    files.forget("files/a")
+    files.forget("files/b")
+    assert files.get("files/a") is None
+    assert files.stats() == {"entries": 0, "invalidations": 1}
+
+
+def test_bounded():
+    files = ActiveFiles(maxsize=2)
+    for name in ("files/a", "files/b", "files/c"):
+        files.remember(name, remote_file(name))
+    assert files.stats()["entries"] == 2
+
+
+class FileClient:
+    def __init__(self, files):
+        self.files = files
+        self.gets = 0
+
+    async def get_file(self, name):
+        self.gets += 1
+        if name not in self.files:
+            raise api_exceptions.NotFound(f"{name} not found")
+        return self.files[name]
+
+
+def test_gone_file_is_looked_up_again(monkeypatch):
+    client = FileClient({"files/a": remote_file("files/a", 24 * 60 * 60)})
+    monkeypatch.setattr(file_upload, "get_client", lambda: client)
+    monkeypatch.setattr(file_upload, "active_files", ActiveFiles())
+
+    async def lookup():
+        return await file_upload.wait_for_files_active(["files/a"])
+
+    assert asyncio.run(lookup())["files/a"].name == "files/a"
+    assert asyncio.run(lookup())["files/a"].name == "files/a"
+    assert client.gets == 1
+
+    # A model call found the file gone.
+    del client.files["files/a"]
+    file_upload.active_files.forget("files/a")
+    assert isinstance(asyncio.run(lookup())["files/a"], api_exceptions.NotFound)
+    assert client.gets == 2
+
+
+def test_model_call_on_gone_file_forgets_it(monkeypatch):
+    files = ActiveFiles()
+    files.remember("files/a", remote_file("files/a"))
+    monkeypatch.setattr(response_parser, "active_files", files)
+
+    async def gone(*args, **kwargs):
+        raise api_exceptions.PermissionDenied("files/a may not exist")
+
+    monkeypatch.setattr(response_parser, "ask_table", gone)
+    with pytest.raises(api_exceptions.PermissionDenied):
+        asyncio.run(response_parser.request_table(
+            "gemini-1.5-flash", types.SimpleNamespace(name="files/a"), "prompt", {}))
+    assert files.get("files/a") is None
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+import time
+from cachetools import TTLCache
+from google.api_core import exceptions as api_exceptions
+
+# Files uploaded through the Gemini File API are deleted after 48 hours. Drop
+# our mapping an hour earlier so a hit never points at an expired file.
+UPLOAD_TTL = 47 * 60 * 60
+
+UPLOAD_CACHE_BACKEND = os.getenv("UPLOAD_CACHE_BACKEND", "memory")
+UPLOAD_CACHE_PATH = os.getenv("UPLOAD_CACHE_PATH", "upload_cache.sqlite3")
+UPLOAD_CACHE_SIZE = int(os.getenv("UPLOAD_CACHE_SIZE", "1024"))
+ACTIVE_FILE_CACHE_SIZE = int(os.getenv("ACTIVE_FILE_CACHE_SIZE", "1024"))
+
+# A file is not handed out from memory this close to its File API expiry.
+FILE_EXPIRY_MARGIN = 60 * 60
+
+# What the API returns for a file it has deleted.
+FILE_GONE_ERRORS = (api_exceptions.NotFound, api_exceptions.PermissionDenied)
+
+
+class MemoryUploadStore:
+    """LRU store with per-entry expiry, local to the process."""
+
+    def __init__(self, maxsize=UPLOAD_CACHE_SIZE, ttl=UPLOAD_TTL):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, digest):
+        return self.entries.get(digest)
+
+    def set(self, digest, fileName):
+        self.entries[digest] = fileName
+
+    def delete(self, digest):
+        self.entries.pop(digest, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteUploadStore:
+    """On-disk store so the mapping survives restarts and is shared by workers."""
+
+    def __init__(self, path=UPLOAD_CACHE_PATH, maxsize=UPLOAD_CACHE_SIZE, ttl=UPLOAD_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "digest TEXT PRIMARY KEY, file_name TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL)")
+
+    def get(self, digest):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT file_name, expires_at FROM uploads WHERE digest = ?",
+                (digest,)).fetchone()
+            if not row:
+                return None
+            if row[1] <= now:
+                self.conn.execute(
+                    "DELETE FROM uploads WHERE digest = ?", (digest,))
+                return None
+            self.conn.execute(
+                "UPDATE uploads SET used_at = ? WHERE digest = ?", (now, digest))
+            return row[0]
+
+    def set(self, digest, fileName):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?)",
+                (digest, fileName, now + self.ttl, now))
+            self.conn.execute("DELETE FROM uploads WHERE expires_at <= ?", (now,))
+            self.conn.execute(
+                "DELETE FROM uploads WHERE digest NOT IN ("
+                "SELECT digest FROM uploads ORDER BY used_at DESC LIMIT ?)",
+                (self.maxsize,))
+
+    def delete(self, digest):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM uploads WHERE digest = ?", (digest,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+
+
+class UploadCache:
+    """Maps the SHA-256 of uploaded bytes to the remote Gemini file name."""
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, digest):
+        fileName = self.store.get(digest)
+        if fileName:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return fileName
+
+    def peek(self, digest):
+        """Like lookup, without counting a hit or miss."""
+        return self.store.get(digest)
+
+    def remember(self, digest, fileName):
+        self.store.set(digest, fileName)
+
+    def forget(self, digest):
+        self.invalidations += 1
+        self.store.delete(digest)
+
+    def stats(self):
+        return {
+            "backend": type(self.store).__name__,
+            "entries": len(self.store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def expires_soon(file):
+    """Whether the File API deletes `file` within FILE_EXPIRY_MARGIN."""
+    expiration = getattr(file, "expiration_time", None)
+    return expiration is not None and expiration.timestamp() - time.time() < FILE_EXPIRY_MARGIN
+
+
+class ActiveFiles:
+    """Remote files already seen ACTIVE, so they are not polled again.
+
+    An entry lasts until shortly before the file's own expiration_time, or
+    UPLOAD_TTL when the file has none, and is dropped as soon as a call finds
+    the file gone.
+    """
+
+    def __init__(self, maxsize=ACTIVE_FILE_CACHE_SIZE, ttl=UPLOAD_TTL):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.invalidations = 0
+
+    def get(self, fileName):
+        file = self.entries.get(fileName)
+        if file is not None and expires_soon(file):
+            del self.entries[fileName]
+            return None
+        return file
+
+    def remember(self, fileName, file):
+        if not expires_soon(file):
+            self.entries[fileName] = file
+
+    def forget(self, fileName):
+        if self.entries.pop(fileName, None) is not None:
+            self.invalidations += 1
+
+    def stats(self):
+        return {"entries": len(self.entries), "invalidations": self.invalidations}
+
+
+def create_store(backend=UPLOAD_CACHE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteUploadStore()
+    if backend == "memory":
+        return MemoryUploadStore()
+    raise ValueError(f"Unknown upload cache backend: {backend}")
+
+
+upload_cache = UploadCache(create_store())
+active_files = ActiveFiles()